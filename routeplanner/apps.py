@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class RouteplannerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'routeplanner'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from routeplanner.models import GasStation
+        from routeplanner.utils import clear_station_arrays
+
+        # Station edits made through the ORM invalidate the in-memory station arrays
+        post_save.connect(clear_station_arrays, sender=GasStation, dispatch_uid='clear_station_arrays_on_save')
+        post_delete.connect(clear_station_arrays, sender=GasStation, dispatch_uid='clear_station_arrays_on_delete')
@@ -0,0 +1,60 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from routeplanner.models import GasStation
+from routeplanner.services.async_enricher import geocode_many
+from routeplanner.services.gas_station_enricher import build_full_address
+from routeplanner.utils import clear_station_arrays
+
+class Command(BaseCommand):
+    help = 'Geocode gas stations without coordinates, saving progress after every batch so an interrupted run can be resumed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of stations geocoded and saved per batch')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+
+        pending_stations = GasStation.objects.filter(latitude__isnull=True).only('address', 'city', 'state').order_by('pk')
+        self.stdout.write(self.style.SUCCESS(f'Geocoding {pending_stations.count()} gas stations without coordinates'))
+
+        geocoded_count = 0
+        failed_count = 0
+        last_pk = 0
+        while True:
+            # Keyset pagination, so stations that fail to geocode are not fetched again in this run
+            batch = list(pending_stations.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            addresses = {station.pk: build_full_address(station.address, station.city, station.state) for station in batch}
+            # Stations without an address, city or state are never sent to Nominatim
+            geocodable_addresses = list(filter(None, addresses.values()))
+            results = asyncio.run(geocode_many(geocodable_addresses)) if geocodable_addresses else {}
+
+            geocoded_stations = []
+            for station in batch:
+                result = results.get(addresses[station.pk])
+                if not addresses[station.pk]:
+                    self.stdout.write(self.style.WARNING(f'No address to geocode for gas station {station.pk}'))
+                    failed_count += 1
+                elif isinstance(result, Exception):
+                    self.stdout.write(self.style.ERROR(f'Unexpected error calling service for "{addresses[station.pk]}": {result}'))
+                    failed_count += 1
+                elif result:
+                    station.latitude, station.longitude = result
+                    geocoded_stations.append(station)
+                else:
+                    self.stdout.write(self.style.WARNING(f'Could not geocode address: "{addresses[station.pk]}"'))
+                    failed_count += 1
+
+            # Saved per batch: a crash loses at most the batch in flight
+            GasStation.objects.bulk_update(geocoded_stations, ['latitude', 'longitude'])
+            # bulk_update sends no model signals
+            clear_station_arrays()
+            geocoded_count += len(geocoded_stations)
+            self.stdout.write(self.style.SUCCESS(f'Saved coordinates for {geocoded_count} gas stations so far.'))
+
+        self.stdout.write(self.style.SUCCESS(f'Geocoding finished.'))
+        self.stdout.write(self.style.SUCCESS(f'Successfully geocoded {geocoded_count} gas stations.'))
+        self.stdout.write(self.style.WARNING(f'Failed to geocode {failed_count} gas stations.'))
@@ -1,118 +1,204 @@
+import asyncio
 import csv
-import time
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
 from routeplanner.models import GasStation
-from routeplanner.services.gas_station_enricher import GasStationEnricherService
+from routeplanner.services.async_enricher import geocode_many
+from routeplanner.services.gas_station_enricher import NOT_CACHED, build_full_address, lookup_cached_geocode
+from routeplanner.utils import clear_station_arrays
 
 class Command(BaseCommand):
     help = 'Import fuel prices from CSV file and geocode addresses using Nominatim service'
 
+    STAGING_TABLE = 'routeplanner_gasstation_stage'
+    UPDATE_FIELDS = ['truckstop_name', 'address', 'city', 'state', 'rack_id', 'retail_price', 'latitude', 'longitude']
+    FIELDS = ['opis_truckstop_id'] + UPDATE_FIELDS
+    COORDINATE_FIELDS = ('latitude', 'longitude')
+    # Coordinates are kept on re-import only while these are unchanged
+    ADDRESS_FIELDS = ('address', 'city', 'state')
+    TARGET_ALIAS = 'gs'
+
     def add_arguments(self, parser):
         parser.add_argument('csv_file', type=str, help='Path to the CSV file')
+        parser.add_argument(
+            '--skip-geocoding',
+            action='store_true',
+            help='Only use cached geocoding results and leave the other stations to geocode_gas_stations',
+        )
 
     def handle(self, *args, **kwargs):
         file_path = kwargs['csv_file']
 
-        # Initialize the service
-        self.enricher_service = GasStationEnricherService()
-
         self.stdout.write(self.style.SUCCESS(f'Starting import and geocoding from {file_path}'))
 
         self.processed_count = 0
         self.geocoded_count = 0
         self.failed_count = 0
+        self.created_count = 0
+        self.updated_count = 0
 
-        # Use a transaction to ensure data integrity
+        rows = []
         try:
             with open(file_path, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    self._process_row(row) # Call the new private method
+                rows = list(csv.DictReader(csvfile))
         except FileNotFoundError:
             self.stdout.write(self.style.ERROR(f"Error: CSV file not found at {file_path}"))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"An unexpected error occurred during file processing: {e}"))
 
+        # Geocode every distinct address up front, concurrently but rate limited
+        addresses = [self._construct_full_address(row) for row in rows]
+        if kwargs.get('skip_geocoding'):
+            geocoded_addresses = self._lookup_cached_geocodes(addresses)
+        else:
+            geocoded_addresses = asyncio.run(geocode_many(filter(None, addresses))) if rows else {}
+
+        self._records = {}
+        for row, full_address in zip(rows, addresses):
+            self._process_row(row, full_address, geocoded_addresses)
+
+        # Use a transaction to ensure data integrity
+        with transaction.atomic():
+            self._merge_records()
+
         self.stdout.write(self.style.SUCCESS(f'Import process finished.'))
         self.stdout.write(self.style.SUCCESS(f'Successfully processed {self.processed_count} records.'))
+        self.stdout.write(self.style.SUCCESS(f'Created {self.created_count} and updated {self.updated_count} gas stations.'))
         self.stdout.write(self.style.SUCCESS(f'Successfully geocoded {self.geocoded_count} addresses.'))
         self.stdout.write(self.style.WARNING(f'Failed to geocode or save {self.failed_count} records.'))
 
 
-    def _process_row(self, row):
-        """Processes a single row from the CSV, geocodes, and saves to the database."""
-        full_address = self._construct_full_address(row)
-
+    def _process_row(self, row, full_address, geocoded_addresses):
+        """Saves a single row from the CSV to the database using its geocoding result."""
         latitude = None
         longitude = None
         geocoding_successful = False
 
         if full_address:
-            latitude, longitude, geocoding_successful = self._geocode_address_with_retries(full_address)
+            latitude, longitude, geocoding_successful = self._unpack_geocode_result(
+                full_address, geocoded_addresses.get(full_address)
+            )
 
         self._save_gas_station_record(row, latitude, longitude, geocoding_successful)
 
 
     def _construct_full_address(self, row):
-        """Constructs a full address string from a CSV row."""
-        address_parts = [
-            row.get('Address', '').strip(),
-            row.get('City', '').strip(),
-            row.get('State', '').strip(),
-            'USA' # Assuming all addresses are in the USA
-        ]
-        return ", ".join(filter(None, address_parts))
-
-
-    def _geocode_address_with_retries(self, full_address):
-        """Attempts to geocode an address with retries and delays."""
-        retries = 1 # retry disabled for tests
-        for attempt in range(retries):
-            try:
-                coords = self.enricher_service.geocode_address(full_address)
-                if coords:
-                    self.stdout.write(self.style.SUCCESS(f'Geocoded "{full_address}"'))
-                    return coords[0], coords[1], True # Return lat, lon, and success status
-                else:
-                    self.stdout.write(self.style.WARNING(f'Could not geocode address (attempt {attempt + 1}/{retries}): "{full_address}"'))
-                    if attempt < retries - 1:
-                         time.sleep(2) # Wait before retrying
-                    else:
-                         return None, None, False # Return None coords and failure status
-
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Unexpected error calling service for "{full_address}": {e}'))
-                return None, None, False # Return None coords and failure status
-
-        # Add a small delay between requests to respect Nominatim's usage policy
-        # This delay is crucial even after retries for a single address
-        time.sleep(1)
-        return None, None, False # Should ideally not reach here if retries are exhausted
+        """Constructs a full, normalized address string from a CSV row."""
+        return build_full_address(row.get('Address') or '', row.get('City') or '', row.get('State') or '')
+
+
+    def _lookup_cached_geocodes(self, addresses):
+        """Returns the cached geocoding results for addresses, without calling Nominatim."""
+        geocoded_addresses = {}
+        for address in dict.fromkeys(filter(None, addresses)):
+            cached = lookup_cached_geocode(address)
+            if cached is not NOT_CACHED:
+                geocoded_addresses[address] = cached
+        return geocoded_addresses
+
+
+    def _unpack_geocode_result(self, full_address, result):
+        """Interprets the geocode_many result for an address and reports the outcome."""
+        if isinstance(result, Exception):
+            self.stdout.write(self.style.ERROR(f'Unexpected error calling service for "{full_address}": {result}'))
+            return None, None, False
+
+        if result:
+            self.stdout.write(self.style.SUCCESS(f'Geocoded "{full_address}"'))
+            self.geocoded_count += 1
+            return result[0], result[1], True # Return lat, lon, and success status
+
+        self.stdout.write(self.style.WARNING(f'Could not geocode address: "{full_address}"'))
+        return None, None, False
 
 
     def _save_gas_station_record(self, row, latitude, longitude, geocoding_successful):
-        """Creates or updates a GasStation record."""
+        """Queues the values of a GasStation record to be created or updated."""
+        opis_truckstop_id = row.get('OPIS Truckstop ID', '').strip()
         try:
-            # Use GasStation model
-            GasStation.objects.update_or_create(
-                opis_truckstop_id=row.get('OPIS Truckstop ID', '').strip(),
-                defaults={
-                    'truckstop_name': row.get('Truckstop Name', '').strip(),
-                    'address': row.get('Address', '').strip(),
-                    'city': row.get('City', '').strip(),
-                    'state': row.get('State', '').strip(),
-                    'rack_id': row.get('Rack ID', '').strip(),
-                    'retail_price': float(row.get('Retail Price', 0.0)),
-                    'latitude': latitude,
-                    'longitude': longitude,
-                }
+            record = (
+                opis_truckstop_id,
+                row.get('Truckstop Name', '').strip(),
+                row.get('Address', '').strip(),
+                row.get('City', '').strip(),
+                row.get('State', '').strip(),
+                row.get('Rack ID', '').strip(),
+                float(row.get('Retail Price', 0.0)),
+                latitude,
+                longitude,
             )
-            self.processed_count += 1
-            if not geocoding_successful:
-                 self.stdout.write(self.style.ERROR(f'Failed to get the geolocation for OPIS ID {row.get("OPIS Truckstop ID", "")}'))
-
         except Exception as e:
              self.stdout.write(self.style.ERROR(f'Failed to save record for OPIS ID {row.get("OPIS Truckstop ID", "")}: {e}'))
              self.failed_count += 1 # Count as failed if saving fails
-
+             return
+
+        # Later rows for the same station win, as they would with one update per row
+        self._records[opis_truckstop_id] = record
+        self.processed_count += 1
+        if not geocoding_successful:
+             self.stdout.write(self.style.ERROR(f'Failed to get the geolocation for OPIS ID {row.get("OPIS Truckstop ID", "")}'))
+
+
+    def _merge_records(self):
+        """
+        Upserts every queued record with a single server-side statement.
+
+        The raw value tuples are loaded into a temporary staging table, which is then
+        merged into the GasStation table with INSERT ... SELECT ... ON CONFLICT, so no
+        model instances are built and the database applies all rows in one pass.
+        """
+        if not self._records:
+            return
+
+        # One query for every existing ID, so the summary can tell inserts from updates
+        existing_ids = set(GasStation.objects.values_list('opis_truckstop_id', flat=True))
+        self.updated_count = sum(1 for opis_truckstop_id in self._records if opis_truckstop_id in existing_ids)
+        self.created_count = len(self._records) - self.updated_count
+
+        quote_name = connection.ops.quote_name
+        table = quote_name(GasStation._meta.db_table)
+        staging_table = quote_name(self.STAGING_TABLE)
+        fields = [GasStation._meta.get_field(name) for name in self.FIELDS]
+        columns = ', '.join(quote_name(field.column) for field in fields)
+        column_definitions = ', '.join(f'{quote_name(field.column)} {field.db_type(connection)}' for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        updates = ', '.join(self._update_expression(quote_name, name) for name in self.UPDATE_FIELDS)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE {staging_table} ({column_definitions})')
+            try:
+                cursor.executemany(
+                    f'INSERT INTO {staging_table} ({columns}) VALUES ({placeholders})',
+                    list(self._records.values()),
+                )
+                # WHERE true keeps SQLite from parsing ON CONFLICT as part of the SELECT
+                cursor.execute(
+                    f'INSERT INTO {table} AS {quote_name(self.TARGET_ALIAS)} ({columns}) SELECT {columns} FROM {staging_table} WHERE true '
+                    f'ON CONFLICT ({quote_name("opis_truckstop_id")}) DO UPDATE SET {updates}'
+                )
+            finally:
+                cursor.execute(f'DROP TABLE {staging_table}')
+        # Raw SQL sends no model signals
+        clear_station_arrays()
+        self._records = {}
+
+
+    def _update_expression(self, quote_name, name):
+        """
+        Builds the SET clause of one field for the upsert.
+
+        A staged row without coordinates, e.g. an address missing from the cache with
+        --skip-geocoding, keeps the station's existing coordinates while its address,
+        city and state are unchanged, rather than overwriting them with NULL.
+        """
+        column = quote_name(name)
+        if name not in self.COORDINATE_FIELDS:
+            return f'{column} = excluded.{column}'
+        target = quote_name(self.TARGET_ALIAS)
+        same_address = ' AND '.join(
+            f'excluded.{quote_name(field)} = {target}.{quote_name(field)}' for field in self.ADDRESS_FIELDS
+        )
+        return (
+            f'{column} = CASE WHEN excluded.{column} IS NULL AND {same_address} '
+            f'THEN {target}.{column} ELSE excluded.{column} END'
+        )
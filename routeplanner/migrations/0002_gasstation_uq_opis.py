@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-14 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routeplanner', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='gasstation',
+            constraint=models.UniqueConstraint(fields=('opis_truckstop_id',), name='uq_opis'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-14 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routeplanner', '0002_gasstation_uq_opis'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gasstation',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='gasstation',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
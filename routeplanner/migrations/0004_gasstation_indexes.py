@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-14 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routeplanner', '0003_gasstation_float_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gasstation',
+            index=models.Index(fields=['latitude', 'longitude'], name='gs_latlon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gasstation',
+            index=models.Index(fields=['state', 'city'], name='gs_state_city_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-14 06:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routeplanner', '0004_gasstation_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='gasstation',
+            name='gs_latlon_idx',
+        ),
+    ]
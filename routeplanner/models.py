@@ -9,8 +9,18 @@ class GasStation(models.Model):
     rack_id = models.CharField(max_length=100)
     retail_price = models.DecimalField(max_digits=6, decimal_places=2)
 
-    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
-    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Plain doubles: coordinates only feed float math, unlike the price kept as Decimal
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Required by the import command's bulk upsert on opis_truckstop_id
+            models.UniqueConstraint(fields=['opis_truckstop_id'], name='uq_opis'),
+        ]
+        indexes = [
+            models.Index(fields=['state', 'city'], name='gs_state_city_idx'),
+        ]
 
     def __str__(self):
         return f"{self.truckstop_name} - {self.city}, {self.state}"
@@ -1,6 +1,10 @@
+import re
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+# "longitude,latitude" with optional whitespace around each number
+_COORD_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
 class RouteParametersSerializer(serializers.Serializer):
     """
     Serializer to validate and parse start and end coordinates from query parameters.
@@ -8,6 +12,11 @@ class RouteParametersSerializer(serializers.Serializer):
     """
     start = serializers.CharField(help_text="Start coordinates as 'longitude,latitude'")
     end = serializers.CharField(help_text="End coordinates as 'longitude,latitude'")
+    geometry_format = serializers.ChoiceField(
+        choices=['latlon', 'polyline'],
+        default='latlon',
+        help_text="Route geometry as [latitude, longitude] pairs ('latlon') or an encoded polyline string ('polyline')",
+    )
 
     def validate_start(self, value):
         """
@@ -26,27 +35,15 @@ class RouteParametersSerializer(serializers.Serializer):
         Helper method to validate and convert a single coordinate string.
         Expected format: "longitude,latitude" (both floats).
         """
-        try:
-            # Split the string by comma
-            lon_str, lat_str = value.split(',')
-            # Convert to floats
-            longitude = float(lon_str)
-            latitude = float(lat_str)
-
-            # Optional: Add checks for valid coordinate ranges if needed
-            # e.g., -180 <= longitude <= 180 and -90 <= latitude <= 90
-            if not (-180 <= longitude <= 180):
-                 raise ValidationError(f"Invalid longitude value for {field_name}.")
-            if not (-90 <= latitude <= 90):
-                 raise ValidationError(f"Invalid latitude value for {field_name}.")
-
-            return [latitude, longitude]
-
-        except ValueError:
-            # Handle cases where splitting or float conversion fails
+        match = _COORD_RE.match(value)
+        if not match:
             raise ValidationError(f"Invalid format for {field_name}. Expected 'longitude,latitude'.")
-        except Exception as e:
-            # Catch any other unexpected errors during validation
-            raise ValidationError(f"Error validating {field_name}: {e}")
 
+        longitude, latitude = float(match.group(1)), float(match.group(2))
+        if longitude < -180 or longitude > 180:
+            raise ValidationError(f"Invalid longitude value for {field_name}.")
+        if latitude < -90 or latitude > 90:
+            raise ValidationError(f"Invalid latitude value for {field_name}.")
 
+        # RoutePlanner and OpenRouteService take coordinates as [longitude, latitude]
+        return [longitude, latitude]
@@ -0,0 +1,93 @@
+import asyncio
+import aiohttp
+from django.conf import settings
+from routeplanner.services.gas_station_enricher import (
+    GasStationEnricherService,
+    NOT_CACHED,
+    lookup_cached_geocode,
+    store_cached_geocode,
+)
+
+# Nominatim's usage policy allows at most one request per second
+NOMINATIM_MIN_INTERVAL_SECONDS = 1.0
+
+
+async def _geocode_one(session, address, limiter):
+    """
+    Geocodes a single address through a shared aiohttp session.
+
+    The limiter is held for the request and for the minimum interval after it,
+    so any number of concurrent tasks still respects Nominatim's rate limit.
+
+    Args:
+        session: The aiohttp.ClientSession used for the request.
+        address: The address string to geocode.
+        limiter: The asyncio.Semaphore shared by every geocoding task.
+
+    Returns:
+        A tuple (latitude, longitude) if geocoding is successful, otherwise None.
+    """
+    params = {
+        'q': address,
+        'format': 'json',
+        'limit': 1,
+    }
+
+    async with limiter:
+        try:
+            async with session.get(GasStationEnricherService.NOMINATIM_SEARCH_URL, params=params) as response:
+                response.raise_for_status()
+                data = await response.json()
+        finally:
+            await asyncio.sleep(NOMINATIM_MIN_INTERVAL_SECONDS)
+
+    if data and isinstance(data, list):
+        location = data[0]
+        return (float(location.get('lat')), float(location.get('lon')))
+    return None
+
+
+async def geocode_many(addresses):
+    """
+    Geocodes many addresses concurrently over a single pooled aiohttp session.
+
+    Duplicate addresses are geocoded only once, and addresses found in the
+    persistent geocode cache are not sent to Nominatim at all. Errors are not
+    raised; they are returned in place of the result for the address that
+    caused them.
+
+    Args:
+        addresses: An iterable of address strings.
+
+    Returns:
+        A dict mapping each address to a (latitude, longitude) tuple, to None if
+        Nominatim found no match, or to the exception raised while geocoding it.
+    """
+    results = {}
+    pending_addresses = []
+    for address in dict.fromkeys(addresses):
+        cached = lookup_cached_geocode(address)
+        if cached is NOT_CACHED:
+            pending_addresses.append(address)
+        else:
+            results[address] = cached
+
+    if not pending_addresses:
+        return results
+
+    limiter = asyncio.Semaphore(1)
+
+    async with aiohttp.ClientSession(
+        headers={'User-Agent': settings.NOMINATIM_USER_AGENT},
+        connector=aiohttp.TCPConnector(limit=4, ttl_dns_cache=600),
+        timeout=aiohttp.ClientTimeout(total=10),
+    ) as session:
+        tasks = [asyncio.create_task(_geocode_one(session, address, limiter)) for address in pending_addresses]
+        fetched = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for address, result in zip(pending_addresses, fetched):
+        if not isinstance(result, Exception):
+            store_cached_geocode(address, result)
+        results[address] = result
+
+    return results
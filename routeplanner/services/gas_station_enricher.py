@@ -1,9 +1,71 @@
+import hashlib
+import re
 import time
-import requests
 from django.conf import settings
+from django.core.cache import caches
+from routeplanner.services.sessions import build_session
 # Import specific requests exceptions for better error handling
 from requests.exceptions import RequestException, Timeout, ConnectionError, HTTPError
 
+GEOCODE_CACHE_TIMEOUT = 30 * 86400 # Addresses rarely move, keep hits for 30 days
+GEOCODE_MISS_CACHE_TIMEOUT = 7 * 86400 # Retry unresolvable addresses after a week
+
+# Appended to every station address, all stations are in the USA
+ADDRESS_COUNTRY = 'USA'
+
+# Returned by lookup_cached_geocode when an address has no cache entry
+NOT_CACHED = object()
+# Stored in the cache for addresses Nominatim could not resolve
+_NO_MATCH = 'no-match'
+
+
+def normalize_address(address):
+    """Canonicalizes case and whitespace so equivalent addresses compare equal."""
+    return re.sub(r'\s+', ' ', address.lower().strip())
+
+
+def build_full_address(address, city, state):
+    """
+    Builds the normalized address string geocoded for a gas station.
+    Returns an empty string when the station has no address, city or state.
+    """
+    address_parts = [part for part in (address.strip(), city.strip(), state.strip()) if part]
+    if not address_parts:
+        return ''
+    address_parts.append(ADDRESS_COUNTRY)
+    # Normalize so the geocode cache key is stable across imports
+    return normalize_address(', '.join(address_parts))
+
+
+def geocode_cache_key(address):
+    """Builds the geocode cache key for an address."""
+    digest = hashlib.blake2b(normalize_address(address).encode(), digest_size=16).hexdigest()
+    return f'geocode:{digest}'
+
+
+def lookup_cached_geocode(address):
+    """
+    Looks up an address in the persistent geocode cache.
+
+    Returns:
+        A tuple (latitude, longitude) or None for a previously geocoded address,
+        otherwise NOT_CACHED.
+    """
+    hit = caches['geocode'].get(geocode_cache_key(address))
+    if hit is None:
+        return NOT_CACHED
+    if hit == _NO_MATCH:
+        return None
+    return tuple(hit)
+
+
+def store_cached_geocode(address, coords):
+    """Stores a geocoding result, or the absence of one when coords is None."""
+    if coords is None:
+        caches['geocode'].set(geocode_cache_key(address), _NO_MATCH, timeout=GEOCODE_MISS_CACHE_TIMEOUT)
+    else:
+        caches['geocode'].set(geocode_cache_key(address), coords, timeout=GEOCODE_CACHE_TIMEOUT)
+
 class GasStationEnricherService:
     # Nominatim API endpoint for search
     NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search" # NOTE: NOMINATIM IS FREE BUT NOT GOOD AS GOOGLE MAPS NOT CLOSE
@@ -17,10 +79,15 @@ class GasStationEnricherService:
             'User-Agent': self.user_agent
         }
 
+        # Reuse pooled keep-alive connections across geocoding calls
+        self.session = build_session(self.headers)
+
 
     def geocode_address(self, address):
         """
         Geocodes a single address using the Nominatim API via requests.
+        Results, including addresses without a match, are served from the
+        persistent geocode cache when available.
 
         Args:
             address: The address string to geocode.
@@ -28,6 +95,10 @@ class GasStationEnricherService:
         Returns:
             A tuple (latitude, longitude) if geocoding is successful, otherwise None.
         """
+        cached = lookup_cached_geocode(address)
+        if cached is not NOT_CACHED:
+            return cached
+
         # Parameters for the Nominatim search request
         params = {
             'q': address,
@@ -35,15 +106,13 @@ class GasStationEnricherService:
             'limit': 1,      # Request only the top result
         }
 
-        # Retry logic will be handled by the caller (e.g., the management command)
-        # This method will focus on making a single request and handling its immediate response.
+        # Transient HTTP failures are retried by the session's adapter
         try:
             # Make the GET request to the Nominatim API
             # Use a timeout to prevent hanging indefinitely
-            response = requests.get(
+            response = self.session.get(
                 self.NOMINATIM_SEARCH_URL,
                 params=params,
-                headers=self.headers,
                 timeout=10
             )
 
@@ -55,8 +124,10 @@ class GasStationEnricherService:
                 location = data[0]
                 latitude = float(location.get('lat'))
                 longitude = float(location.get('lon'))
+                store_cached_geocode(address, (latitude, longitude))
                 return (latitude, longitude)
             else:
+                store_cached_geocode(address, None)
                 return None
 
         except Timeout:
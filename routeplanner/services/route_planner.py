@@ -1,13 +1,33 @@
+import numpy as np
+import orjson
 import requests
 from django.conf import settings
-from routeplanner.utils import find_stops, haversine, calculate_cumulative_distances
+from django.core.cache import cache
+from routeplanner.services.sessions import build_session
+from routeplanner.utils import find_stops, calculate_cumulative_distances, find_nearest_route_point_indices, encode_polyline
 # Removed imports for stdout and style
 
+
+class RoutePlanError(Exception):
+    """Raised when a route cannot be planned, e.g. OpenRouteService failed or returned no route."""
+
+
 class RoutePlanner:
     FUEL_EFFICIENCY = 10  # mpg
     MAX_RANGE = 1  # miles
     DEFAULT_PRICE_PER_GALLON = 3.00
     ROUTE_SERVICE_BASE_URL = 'https://api.openrouteservice.org/v2/directions/driving-car'
+    ROUTE_CACHE_TIMEOUT = 7 * 86400 # seconds
+    ROUTE_CACHE_PRECISION = 4 # decimal places, roughly 11 meters
+    # Planned results depend on fuel prices, so they expire far sooner than routes
+    PLAN_CACHE_TIMEOUT = 300 # seconds
+    # Single precision keeps vertices to about a meter and halves the route's memory and cache size.
+    # Distances are still accumulated in float64 by calculate_cumulative_distances.
+    ROUTE_COORDS_DTYPE = np.float32
+    # Decimal places of the [lat, lon] route geometry in responses, about a meter
+    ROUTE_GEOMETRY_PRECISION = 5
+    # Shared by all planners so every request reuses the pooled ORS connection
+    session = build_session(pool_connections=1)
 
     def __init__(self, start_coords, end_coords):
         """
@@ -28,6 +48,7 @@ class RoutePlanner:
         Calls the OpenRouteService API for the initial route (start to end).
         Uses the GET request structure shown in the user's image.
         This method is called only once in the plan().
+        Responses are cached by start and end coordinates rounded to about 11 meters.
 
         Args:
             start_segment_coords: [longitude, latitude] for the segment start.
@@ -35,12 +56,12 @@ class RoutePlanner:
 
         Returns:
             A tuple containing:
-            - coords: List of [longitude, latitude] pairs for the segment geometry.
+            - coords: float32 NumPy array of shape (R, 2) with [longitude, latitude] rows for the segment geometry.
             - distance_m: Total distance of the segment in meters.
             - duration_s: Total duration of the segment in seconds.
 
         Raises:
-            Exception: If the API call fails.
+            RoutePlanError: If the API call fails or its response cannot be read.
         """
         # Format coordinates as strings "longitude,latitude" for GET parameters
         start_param = f"{start_segment_coords[0]},{start_segment_coords[1]}"
@@ -54,34 +75,51 @@ class RoutePlanner:
             'details': 'distance,duration', # Request distance and duration
         }
 
-        
+        cache_key = self._route_cache_key(start_segment_coords, end_segment_coords)
+        cached_route = cache.get(cache_key)
+        if cached_route is not None:
+            return cached_route
 
         try:
             # Use GET request as shown in the image
-            resp = requests.get(self.ROUTE_SERVICE_BASE_URL, params=route_params)
+            resp = self.session.get(self.ROUTE_SERVICE_BASE_URL, params=route_params)
             resp.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
 
-            route_data = resp.json()
+            route_data = orjson.loads(resp.content)
 
             if not route_data.get('features'):
-                 raise Exception("No route features found in initial route response.")
+                 raise RoutePlanError("No route features found in initial route response.")
 
             feature = route_data['features'][0]
-            coords = feature['geometry']['coordinates'] # List of [lon, lat] pairs for the route
+            coords = np.asarray(feature['geometry']['coordinates'], dtype=self.ROUTE_COORDS_DTYPE).reshape(-1, 2) # (R, 2) [lon, lat] rows for the route
+            if not len(coords):
+                 raise RoutePlanError("No route geometry found in initial route response.")
             summary = feature['properties']['summary']
             distance_m = summary['distance']
             duration_s = summary['duration']
 
+            cache.set(cache_key, (coords, distance_m, duration_s), timeout=self.ROUTE_CACHE_TIMEOUT)
             return coords, distance_m, duration_s
 
         except requests.exceptions.RequestException as e:
-            raise Exception(f'Failed to get initial route from OpenRouteService: {e}')
+            raise RoutePlanError(f'Failed to get initial route from OpenRouteService: {e}')
         except Exception as e:
              # Catch other potential errors during JSON parsing or data extraction
-             raise Exception(f'Error processing OpenRouteService initial route response: {e}')
+             raise RoutePlanError(f'Error processing OpenRouteService initial route response: {e}')
+
+
+    def _route_cache_key(self, start_segment_coords, end_segment_coords):
+        """Builds the route cache key from the rounded segment coordinates."""
+        rounded = [round(value, self.ROUTE_CACHE_PRECISION) for value in (*start_segment_coords, *end_segment_coords)]
+        return "ors:{},{}:{},{}".format(*rounded)
+
 
+    def _plan_cache_key(self, geometry_format):
+        """Builds the plan cache key from the rounded start and end coordinates and the geometry format."""
+        return f"plan:{geometry_format}:{self._route_cache_key(self.start_coords, self.end_coords)}"
 
-    def plan(self):
+
+    def plan(self, geometry_format='latlon'):
         """
         Plans the optimal route including fuel stops based on a single initial route.
 
@@ -90,23 +128,37 @@ class RoutePlanner:
         2. Find optimal fuel stops along this initial route geometry.
         3. Calculate the total fuel cost based on segments of the initial route defined by the stops.
 
+        Successful plans are cached for PLAN_CACHE_TIMEOUT seconds.
+
+        Args:
+            geometry_format: 'latlon' to return the route geometry as [lat, lon] pairs,
+                or 'polyline' to return it as a Google encoded polyline string.
+
         Returns:
             A dictionary containing route details, fuel stops, and total cost.
+
+        Raises:
+            RoutePlanError: If the initial route cannot be retrieved.
         """
+        # Nearby requests share a plan, as they share the route it is based on
+        plan_cache_key = self._plan_cache_key(geometry_format)
+        cached_plan = cache.get(plan_cache_key)
+        if cached_plan is not None:
+            return cached_plan
+
         # 1. Get the initial route from start to end (ONE API CALL)
-        try:
-            initial_route_coords, initial_distance_m, initial_duration_s = self._get_initial_route(self.start_coords, self.end_coords)
-            initial_distance_miles = initial_distance_m / 1609.34
-        except Exception as e:
-            
-            return {'error': f"Could not plan route: {e}"}
+        initial_route_coords, initial_distance_m, initial_duration_s = self._get_initial_route(self.start_coords, self.end_coords)
+        initial_distance_miles = initial_distance_m / 1609.34
 
 
         # 2. Find optimal fuel stops along this initial route geometry
         
+        # Cumulative distances are computed once and shared by stop finding and costing
+        cumulative_distances = calculate_cumulative_distances(initial_route_coords, initial_distance_miles)
+
         # find_stops now queries the GasStation model directly and uses the route geometry
         # to identify stops along the path.
-        optimal_stops = find_stops(initial_route_coords, initial_distance_miles, self.MAX_RANGE)
+        optimal_stops = find_stops(initial_route_coords, initial_distance_miles, self.MAX_RANGE, cumulative_distances)
 
         
         # Sort stops by distance from start (approximation from find_stops)
@@ -115,57 +167,75 @@ class RoutePlanner:
 
         # 3. Calculate the total fuel cost based on segments of the initial route defined by the stops.
         
-        total_fuel_cost = self._calculate_total_fuel_cost_on_route(initial_route_coords, initial_distance_miles, optimal_stops)
+        total_fuel_cost = self._calculate_total_fuel_cost_on_route(initial_route_coords, initial_distance_miles, optimal_stops, cumulative_distances)
 
 
         # Prepare the final response
         # Return route geometry as [lat, lon] for easier use with mapping libraries on frontend
-        initial_route_coords_latlon = [[coord[1], coord[0]] for coord in initial_route_coords]
-
-        return {
+        initial_route_coords_latlon = initial_route_coords[:, ::-1]
+        if geometry_format == 'polyline':
+            # Far more compact on the wire than nested coordinate lists
+            route_geometry = encode_polyline(initial_route_coords_latlon)
+        else:
+            # Rounded so float32 noise (e.g. 40.70000076) does not leak into the JSON
+            route_geometry = initial_route_coords_latlon.astype(np.float64).round(self.ROUTE_GEOMETRY_PRECISION).tolist()
+
+        result = {
             'total_distance_miles': round(initial_distance_miles, 2),
             'total_duration_seconds': initial_duration_s,
             'total_fuel_cost_usd': round(total_fuel_cost, 2),
             'fuel_stops': optimal_stops, # Return the list of selected stops
-            'route_geometry': initial_route_coords_latlon, # Return the initial route geometry
+            'route_geometry': route_geometry, # Return the initial route geometry
         }
+        # Errors are raised above without being cached, so they are retried
+        cache.set(plan_cache_key, result, timeout=self.PLAN_CACHE_TIMEOUT)
+        return result
 
-    def _calculate_total_fuel_cost_on_route(self, route_coords, total_route_distance_miles, optimal_stops):
+    def _calculate_total_fuel_cost_on_route(self, route_coords, total_route_distance_miles, optimal_stops, cumulative_distances=None):
         """
         Calculates the total fuel cost based on the initial route and fuel prices at stops.
         This assumes fuel is consumed along the initial route geometry.
 
         Args:
-            route_coords: The list of [lon, lat] pairs for the initial route geometry.
+            route_coords: The (R, 2) array of [lon, lat] rows for the initial route geometry.
             total_route_distance_miles: The total distance of the initial route in miles.
             optimal_stops: The list of selected optimal fuel stop dictionaries.
+            cumulative_distances: Precomputed cumulative distances for route_coords, calculated if omitted.
 
         Returns:
             The total estimated fuel cost in USD.
         """
+        # Locals avoid repeated attribute lookups in the segment loop
+        gallons_per_mile = 1.0 / self.FUEL_EFFICIENCY
+        default_price_per_gallon = self.DEFAULT_PRICE_PER_GALLON
+
+        # Without stops the whole route is driven at the default price
+        if not optimal_stops:
+            return total_route_distance_miles * gallons_per_mile * default_price_per_gallon
+
         total_cost = 0
         # Assume no initial price, or set a default if needed. Using DEFAULT_PRICE_PER_GALLON.
 
-        # Calculate cumulative distances along the route points
-        cumulative_distances = calculate_cumulative_distances(route_coords, total_route_distance_miles)
+        # Calculate cumulative distances along the route points unless plan() already did
+        if cumulative_distances is None:
+            cumulative_distances = calculate_cumulative_distances(route_coords, total_route_distance_miles)
+
+        # Map the stops back onto the route geometry.
+        # This is an approximation: find the closest point on the route line to the stop's coordinates
+        # and use its cumulative distance. All stops are matched in one vectorized pass.
+        closest_route_point_indices = find_nearest_route_point_indices(
+            route_coords, [stop['location'] for stop in optimal_stops]
+        )
+
+        # A single stop splits the route into two segments, priced directly
+        if len(optimal_stops) == 1:
+            first_distance, second_distance = sorted((cumulative_distances[closest_route_point_indices[0]], total_route_distance_miles))
+            return (first_distance * default_price_per_gallon
+                    + (second_distance - first_distance) * optimal_stops[0]['fuel_price_per_gallon']) * gallons_per_mile
 
         # Create a list of distances along the route for each waypoint (start, stops, end)
-        # This requires mapping the stop coordinates back onto the route geometry.
         waypoint_distances_along_route = [0] # Start is at distance 0
-
-        # Add distances for the optimal stops
-        # This is an approximation: find the closest point on the route line to the stop's coordinates
-        # and use its cumulative distance.
-        for stop in optimal_stops:
-            stop_coords = [stop['location'][1], stop['location'][0]] # Convert [lat, lon] to [lon, lat]
-            closest_route_point_index = 0
-            min_dist_to_waypoint = float('inf')
-            for i, route_point in enumerate(route_coords):
-                 dist = haversine(stop_coords, route_point)
-                 if dist < min_dist_to_waypoint:
-                     min_dist_to_waypoint = dist
-                     closest_route_point_index = i
-            waypoint_distances_along_route.append(cumulative_distances[closest_route_point_index])
+        waypoint_distances_along_route.extend(cumulative_distances[i] for i in closest_route_point_indices)
 
         waypoint_distances_along_route.append(total_route_distance_miles) # End is at the total distance
 
@@ -182,7 +252,7 @@ class RoutePlanner:
             # Determine the fuel price for this segment
             if i == 0:
                 # First segment (start to first stop or end)
-                current_fuel_price_per_gallon = self.DEFAULT_PRICE_PER_GALLON
+                current_fuel_price_per_gallon = default_price_per_gallon
             else:
                 # Segments between stops or last stop to end
                 # The price is the price at the *start* of the segment (the previous stop)
@@ -197,7 +267,7 @@ class RoutePlanner:
                     current_fuel_price_per_gallon = optimal_stops[-1]['fuel_price_per_gallon']
 
 
-            fuel_needed_segment = segment_distance / self.FUEL_EFFICIENCY
+            fuel_needed_segment = segment_distance * gallons_per_mile
             total_cost += fuel_needed_segment * current_fuel_price_per_gallon
 
 
@@ -0,0 +1,35 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+
+
+def build_session(headers=None, pool_connections=2, pool_maxsize=4):
+    """
+    Builds a requests.Session that keeps connections alive between calls.
+
+    Transient upstream failures (rate limiting, gateway errors) are retried
+    with exponential backoff by the mounted adapter. Compressed responses are
+    requested in every encoding urllib3 can decode here, which includes
+    brotli and zstd when their optional packages are installed.
+
+    Args:
+        headers: Optional dict of headers sent with every request.
+        pool_connections: Number of host connection pools to cache.
+        pool_maxsize: Maximum number of connections kept per pool.
+
+    Returns:
+        A configured requests.Session.
+    """
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 502, 503, 504]),
+    )
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,160 @@
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch, AsyncMock
+from django.core.management import call_command
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from routeplanner.models import GasStation
+from routeplanner.services.gas_station_enricher import store_cached_geocode
+
+
+CSV_HEADER = "OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n"
+
+# Keep geocoding results in memory so tests never touch the persistent cache
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'geocode': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-commands-geocode'},
+}
+
+
+class ParseFuelPricesCommandTests(TestCase):
+    """Tests for the parse_fuel_prices_to_model management command."""
+
+    def _write_csv(self, body):
+        """Writes a temporary CSV file with the fuel prices header and returns its path."""
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', newline='', encoding='utf-8') as csvfile:
+            csvfile.write(CSV_HEADER + body)
+        self.addCleanup(os.remove, path)
+        return path
+
+    @patch('routeplanner.management.commands.parse_fuel_prices_to_model.geocode_many', new_callable=AsyncMock)
+    def test_import_upserts_stations(self, mock_geocode_many):
+        """Test rows are created, existing stations updated and the last duplicate row wins."""
+        GasStation.objects.create(
+            opis_truckstop_id='9', truckstop_name='Old Name', address='Old', city='Old',
+            state='WI', rack_id='1', retail_price=1.00
+        )
+        mock_geocode_many.return_value = {'i-44, exit 283, big cabin, ok, usa': (36.4, -95.2)}
+        path = self._write_csv(
+            '7,WOODSHED,"I-44, EXIT 283",Big Cabin,OK,307,3.00\n'
+            '9,KWIK TRIP,I-94,Tomah,WI,420,3.20\n'
+            '7,WOODSHED OF BIG CABIN,"I-44, EXIT 283",Big Cabin,OK,307,3.50\n'
+            '10,BROKEN,X,Tomah,WI,420,not-a-price\n'
+        )
+
+        stdout = StringIO()
+        call_command('parse_fuel_prices_to_model', path, stdout=stdout)
+
+        self.assertEqual(GasStation.objects.count(), 2)
+        station7 = GasStation.objects.get(opis_truckstop_id='7')
+        self.assertEqual(station7.truckstop_name, 'WOODSHED OF BIG CABIN')
+        self.assertEqual(float(station7.retail_price), 3.50)
+        self.assertAlmostEqual(float(station7.latitude), 36.4)
+        station9 = GasStation.objects.get(opis_truckstop_id='9')
+        self.assertEqual(station9.truckstop_name, 'KWIK TRIP')
+        self.assertIsNone(station9.latitude)
+        self.assertIn('Created 1 and updated 1 gas stations.', stdout.getvalue())
+
+    @override_settings(CACHES=TEST_CACHES)
+    @patch('routeplanner.management.commands.parse_fuel_prices_to_model.geocode_many', new_callable=AsyncMock)
+    def test_import_skip_geocoding_uses_cache_only(self, mock_geocode_many):
+        """Test --skip-geocoding fills coordinates from the cache and never calls Nominatim."""
+        caches['geocode'].clear()
+        store_cached_geocode('i-94, tomah, wi, usa', (43.9, -90.5))
+        path = self._write_csv(
+            '9,KWIK TRIP,I-94,Tomah,WI,420,3.20\n'
+            '7,WOODSHED,"I-44, EXIT 283",Big Cabin,OK,307,3.00\n'
+        )
+
+        call_command('parse_fuel_prices_to_model', path, skip_geocoding=True, stdout=StringIO())
+
+        mock_geocode_many.assert_not_called()
+        self.assertAlmostEqual(GasStation.objects.get(opis_truckstop_id='9').latitude, 43.9)
+        self.assertIsNone(GasStation.objects.get(opis_truckstop_id='7').latitude)
+
+    @override_settings(CACHES=TEST_CACHES)
+    @patch('routeplanner.management.commands.parse_fuel_prices_to_model.geocode_many', new_callable=AsyncMock)
+    def test_import_skip_geocoding_keeps_existing_coordinates(self, mock_geocode_many):
+        """Test re-importing geocoded stations with a cold cache keeps their coordinates unless the address changed."""
+        caches['geocode'].clear()
+        GasStation.objects.bulk_create([
+            GasStation(
+                opis_truckstop_id='9', truckstop_name='KWIK TRIP', address='I-94', city='Tomah', state='WI',
+                rack_id='420', retail_price=3.00, latitude=43.9, longitude=-90.5
+            ),
+            GasStation(
+                opis_truckstop_id='7', truckstop_name='WOODSHED', address='Old', city='Big Cabin', state='OK',
+                rack_id='307', retail_price=3.00, latitude=36.4, longitude=-95.2
+            ),
+        ])
+        path = self._write_csv(
+            '9,KWIK TRIP,I-94,Tomah,WI,420,3.20\n'
+            '7,WOODSHED,"I-44, EXIT 283",Big Cabin,OK,307,3.10\n'
+        )
+
+        call_command('parse_fuel_prices_to_model', path, skip_geocoding=True, stdout=StringIO())
+
+        mock_geocode_many.assert_not_called()
+        station9 = GasStation.objects.get(opis_truckstop_id='9')
+        self.assertEqual(float(station9.retail_price), 3.20)
+        self.assertEqual((station9.latitude, station9.longitude), (43.9, -90.5))
+        # The address moved, so the old coordinates no longer apply
+        station7 = GasStation.objects.get(opis_truckstop_id='7')
+        self.assertIsNone(station7.latitude)
+        self.assertIsNone(station7.longitude)
+
+
+class GeocodeGasStationsCommandTests(TestCase):
+    """Tests for the geocode_gas_stations management command."""
+
+    @patch('routeplanner.management.commands.geocode_gas_stations.geocode_many', new_callable=AsyncMock)
+    def test_geocodes_pending_stations_in_batches(self, mock_geocode_many):
+        """Test only stations without coordinates are geocoded and saved batch by batch."""
+        GasStation.objects.bulk_create([
+            GasStation(
+                opis_truckstop_id='1', truckstop_name='DONE', address='A', city='Tomah', state='WI',
+                rack_id='1', retail_price=3.00, latitude=1.0, longitude=2.0
+            ),
+            GasStation(
+                opis_truckstop_id='2', truckstop_name='PENDING', address='I-94', city='Tomah', state='WI',
+                rack_id='1', retail_price=3.00
+            ),
+            GasStation(
+                opis_truckstop_id='3', truckstop_name='UNKNOWN', address='Nowhere', city='Tomah', state='WI',
+                rack_id='1', retail_price=3.00
+            ),
+        ])
+        mock_geocode_many.side_effect = lambda addresses: {
+            address: (43.9, -90.5) if address == 'i-94, tomah, wi, usa' else None for address in addresses
+        }
+
+        stdout = StringIO()
+        call_command('geocode_gas_stations', batch_size=1, stdout=stdout)
+
+        self.assertEqual(mock_geocode_many.await_count, 2) # One batch per pending station
+        station2 = GasStation.objects.get(opis_truckstop_id='2')
+        self.assertAlmostEqual(station2.latitude, 43.9)
+        self.assertAlmostEqual(station2.longitude, -90.5)
+        self.assertIsNone(GasStation.objects.get(opis_truckstop_id='3').latitude)
+        self.assertEqual(GasStation.objects.get(opis_truckstop_id='1').latitude, 1.0)
+        self.assertIn('Successfully geocoded 1 gas stations.', stdout.getvalue())
+
+    @patch('routeplanner.management.commands.geocode_gas_stations.geocode_many', new_callable=AsyncMock)
+    def test_stations_without_address_not_geocoded(self, mock_geocode_many):
+        """Test stations with no address, city or state count as failed without calling Nominatim."""
+        GasStation.objects.bulk_create([
+            GasStation(
+                opis_truckstop_id='1', truckstop_name='BLANK', address=' ', city='', state='',
+                rack_id='1', retail_price=3.00
+            ),
+        ])
+
+        stdout = StringIO()
+        call_command('geocode_gas_stations', stdout=stdout)
+
+        mock_geocode_many.assert_not_awaited()
+        self.assertIsNone(GasStation.objects.get(opis_truckstop_id='1').latitude)
+        self.assertIn('Failed to geocode 1 gas stations.', stdout.getvalue())
@@ -0,0 +1,28 @@
+import unittest
+from routeplanner.serializers import RouteParametersSerializer
+
+
+class RouteParametersSerializerTests(unittest.TestCase):
+    """Tests for validating the route query parameters."""
+
+    def test_valid_coordinates_parsed_as_lon_lat(self):
+        """Test valid coordinates are returned in [longitude, latitude] order."""
+        serializer = RouteParametersSerializer(data={'start': '-74.0060,40.7128', 'end': ' -77.0369 , 38.9072 '})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['start'], [-74.0060, 40.7128])
+        self.assertEqual(serializer.validated_data['end'], [-77.0369, 38.9072])
+
+    def test_malformed_coordinates_rejected(self):
+        """Test coordinates that are not two comma-separated numbers are rejected."""
+        for value in ['-74.0060', '-74.0060,40.7128,1', 'abc,40.7128', '']:
+            with self.subTest(value=value):
+                serializer = RouteParametersSerializer(data={'start': value, 'end': '-77.0369,38.9072'})
+                self.assertFalse(serializer.is_valid())
+                self.assertIn('start', serializer.errors)
+
+    def test_out_of_range_coordinates_rejected(self):
+        """Test longitude and latitude outside their valid ranges are rejected."""
+        serializer = RouteParametersSerializer(data={'start': '-181,40', 'end': '-77,91'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('Invalid longitude value for start.', serializer.errors['start'])
+        self.assertIn('Invalid latitude value for end.', serializer.errors['end'])
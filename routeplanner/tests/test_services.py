@@ -1,281 +1,501 @@
+import asyncio
 import unittest
-from unittest.mock import patch, MagicMock
-from django.test import TestCase, override_settings
-from requests.exceptions import RequestException, HTTPError, ConnectionError, Timeout
-from django.conf import settings
+import numpy as np
+import orjson
+from unittest.mock import patch, AsyncMock
+from django.test import override_settings
+from django.core.cache import caches
+from requests.exceptions import RequestException, HTTPError, Timeout
+
+from routeplanner.services.route_planner import RoutePlanError, RoutePlanner
+from routeplanner.services.gas_station_enricher import GasStationEnricherService, build_full_address, store_cached_geocode
+from routeplanner.services.async_enricher import geocode_many, _geocode_one
+
+# Keep geocoding results in memory so tests never touch the persistent cache
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'geocode': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-geocode'},
+}
+
+# Mock Django settings for the API keys and caches, applied once for the whole module
+FAKE_ORS_API_KEY = "fake_api_key"
+_test_settings = override_settings(
+    OPENROUTESERVICE_API_KEY=FAKE_ORS_API_KEY,
+    NOMINATIM_USER_AGENT="fake_test_user_agent",
+    CACHES=TEST_CACHES,
+)
+
+
+def setUpModule():
+    _test_settings.enable()
+
+
+def tearDownModule():
+    _test_settings.disable()
+
+# Response payloads shared by the tests, none of which mutates them
+ORS_ROUTE_COORDS = [[-74.0, 40.7], [-75.0, 39.8], [-77.0, 38.9]]
+ORS_SUMMARY = {"distance": 350000, "duration": 12600} # Example distance in meters, duration in seconds
+# A successful OpenRouteService JSON response structure
+ORS_OK = {"features": [{"geometry": {"coordinates": ORS_ROUTE_COORDS}, "properties": {"summary": ORS_SUMMARY}}]}
+ORS_EMPTY = {"features": []}
+ORS_MISSING_GEOMETRY = {"features": [{"properties": {"summary": ORS_SUMMARY}}]}
+ORS_EMPTY_GEOMETRY = {"features": [{"geometry": {"coordinates": []}, "properties": {"summary": ORS_SUMMARY}}]}
+ORS_MISSING_SUMMARY = {"features": [{"geometry": {"coordinates": ORS_ROUTE_COORDS}}]}
+# A successful Nominatim JSON response structure, Nominatim returns lat/lon as strings
+NOMINATIM_OK = [{"lat": "37.4220", "lon": "-122.0840", "display_name": "Googleplex, Mountain View, CA, USA"}]
+
+# Exceptions raised by the mocked requests, built once and shared by the tests
+FORBIDDEN_ERROR = HTTPError("Forbidden")
+NETWORK_ERROR = RequestException("Network is unreachable")
+TIMEOUT_ERROR = Timeout("Request timed out")
+SHARED_ERRORS = (FORBIDDEN_ERROR, NETWORK_ERROR, TIMEOUT_ERROR)
+
+# Example coordinates (start and end) and how they are sent to OpenRouteService
+START_COORDS = [-74.0060, 40.7128]  # New York City
+END_COORDS = [-77.0369, 38.9072]    # Washington D.C.
+START_PARAM = "-74.006,40.7128"
+END_PARAM = "-77.0369,38.9072"
+
+# Expected request parameters, only the geocoded address varies between tests
+EXPECTED_ORS_PARAMS = {
+    'api_key': FAKE_ORS_API_KEY,
+    'start': START_PARAM,
+    'end': END_PARAM,
+    'geometry': 'true',
+    'details': 'distance,duration',
+}
+EXPECTED_NOMINATIM_PARAMS = {'format': 'json', 'limit': 1}
+
+
+class PatchedSessionGetMixin:
+    """
+    Patches get() on the session used by the code under test, once for the whole test class.
+    Subclasses set patched_session_owner to the class or instance holding that session.
+    Tests configure self.mock_get, which is reset before each test.
+    """
+    patched_session_owner = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Only this session is patched, not every requests.Session in the process
+        patcher = patch.object(cls.patched_session_owner.session, 'get')
+        cls.mock_get = patcher.start()
+        cls.addClassCleanup(patcher.stop)
 
-from routeplanner.services.route_planner import RoutePlanner
-from routeplanner.services.gas_station_enricher import GasStationEnricherService
-
-
-# Mock Django settings for the API key
-@override_settings(OPENROUTESERVICE_API_KEY="fake_api_key")
-class RoutePlannerGetInitialRouteTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.mock_get.reset_mock(return_value=True, side_effect=True)
+        # Re-raising an exception extends its traceback, so drop the previous test's frames
+        for error in SHARED_ERRORS:
+            error.__traceback__ = None
+
+
+class FakeResponse:
+    """
+    Pre-canned stand-in for a requests.Response, far lighter than a MagicMock.
+    The body is available both as JSON bytes (content) and through json().
+    raise_exc, when given, is raised by raise_for_status().
+    """
+    __slots__ = ('status_code', 'content', '_json_data', '_raise_exc')
+
+    def __init__(self, json_data=None, status_code=200, raise_exc=None):
+        self.status_code = status_code
+        self.content = orjson.dumps(json_data)
+        self._json_data = json_data
+        self._raise_exc = raise_exc
+
+    def json(self):
+        return self._json_data
+
+    def raise_for_status(self):
+        if self._raise_exc is not None:
+            raise self._raise_exc
+
+
+# All HTTP is mocked and settings are overridden for the whole module, so plain unittest
+# test cases are enough and skip Django's per-test setup and teardown
+class RoutePlannerGetInitialRouteTests(PatchedSessionGetMixin, unittest.TestCase):
+    # The session is shared by all planners
+    patched_session_owner = RoutePlanner
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up one RoutePlanner instance shared by every test, it holds no per-call state."""
+        super().setUpClass()
+        cls.start_coords = START_COORDS
+        cls.end_coords = END_COORDS
+        cls.planner = RoutePlanner(cls.start_coords, cls.end_coords)
 
     def setUp(self):
-        """Set up a RoutePlanner instance for each test."""
-        # Example coordinates (start and end)
-        self.start_coords = [-74.0060, 40.7128]  # New York City
-        self.end_coords = [-77.0369, 38.9072]    # Washington D.C.
-        self.planner = RoutePlanner(self.start_coords, self.end_coords)
+        """Start every test with an empty route cache."""
+        super().setUp()
+        caches['default'].clear()
+
+    def _assert_ors_call(self):
+        """Asserts the route was requested exactly once, from START_COORDS to END_COORDS."""
+        self.mock_get.assert_called_once_with(RoutePlanner.ROUTE_SERVICE_BASE_URL, params=EXPECTED_ORS_PARAMS)
 
 
-    @patch('requests.get') # Patch requests.get for this test method
-    def test_get_initial_route_success(self, mock_get):
+    def test_get_initial_route_success(self):
         """Test successful API call to _get_initial_route."""
-        # Configure the mock requests.get to return a successful response
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.raise_for_status.return_value = None # Simulate no HTTP errors
-        # Simulate a successful OpenRouteService JSON response structure
-        mock_response.json.return_value = {
-            "features": [{
-                "geometry": {"coordinates": [[-74.0, 40.7], [-75.0, 39.8], [-77.0, 38.9]]},
-                "properties": {"summary": {"distance": 350000, "duration": 12600}} # Example distance in meters, duration in seconds
-            }]
-        }
-        mock_get.return_value = mock_response
+        # Configure the mocked session get to return a successful response
+        self.mock_get.return_value = FakeResponse(ORS_OK)
 
         # Call the method being tested
         coords, distance_m, duration_s = self.planner._get_initial_route(
             self.start_coords, self.end_coords
         )
 
-        # Assert that requests.get was called with the correct URL and parameters
-        expected_url = self.planner.ROUTE_SERVICE_BASE_URL
-        expected_params = {
-            'api_key': settings.OPENROUTESERVICE_API_KEY,
-            'start': f"{self.start_coords[0]},{self.start_coords[1]}",
-            'end': f"{self.end_coords[0]},{self.end_coords[1]}",
-            'geometry': 'true',
-            'details': 'distance,duration',
-        }
-        mock_get.assert_called_once_with(expected_url, params=expected_params)
+        # Assert that the session get was called with the correct URL and parameters
+        self._assert_ors_call()
 
         # Assert that the method returned the expected data
-        self.assertEqual(coords, [[-74.0, 40.7], [-75.0, 39.8], [-77.0, 38.9]])
+        self.assertEqual(coords.dtype, np.float32)
+        np.testing.assert_array_equal(coords, np.array(ORS_ROUTE_COORDS, dtype=np.float32))
         self.assertEqual(distance_m, 350000)
         self.assertEqual(duration_s, 12600)
 
 
 
-    @patch('requests.get')
-    def test_get_initial_route_http_error(self, mock_get):
-        """Test API call returning an HTTP error (e.g., 403, 404, 500)."""
-        # Configure the mock requests.get to raise an HTTPError
-        mock_response = MagicMock()
-        mock_response.status_code = 403 # Example: Forbidden
-        # Simulate raise_for_status() raising an HTTPError
-        mock_response.raise_for_status.side_effect = HTTPError("Forbidden", response=mock_response)
-        mock_get.return_value = mock_response
+    def test_get_initial_route_errors(self):
+        """Test each way the API call can fail raises a RoutePlanError describing the failure."""
+        cases = [
+            # HTTP error (e.g., 403, 404, 500) raised by raise_for_status()
+            ('http_error', {'return_value': FakeResponse(status_code=403, raise_exc=FORBIDDEN_ERROR)},
+             'Failed to get initial route from OpenRouteService'),
+            # requests.exceptions.RequestException (e.g., network error)
+            ('request_exception', {'side_effect': NETWORK_ERROR},
+             'Failed to get initial route from OpenRouteService'),
+            ('empty_features', {'return_value': FakeResponse(ORS_EMPTY)},
+             'No route features found in initial route response'),
+            ('empty_geometry', {'return_value': FakeResponse(ORS_EMPTY_GEOMETRY)},
+             'No route geometry found in initial route response'),
+            # Missing keys surface as processing errors (e.g., KeyError)
+            ('missing_geometry', {'return_value': FakeResponse(ORS_MISSING_GEOMETRY)},
+             'Error processing OpenRouteService initial route response'),
+            ('missing_summary', {'return_value': FakeResponse(ORS_MISSING_SUMMARY)},
+             'Error processing OpenRouteService initial route response'),
+        ]
+        for name, mock_config, message in cases:
+            with self.subTest(name):
+                self.mock_get.reset_mock(return_value=True, side_effect=True)
+                self.mock_get.configure_mock(**mock_config)
+
+                with self.assertRaisesRegex(RoutePlanError, message):
+                    self.planner._get_initial_route(self.start_coords, self.end_coords)
 
-        # Assert that calling the method raises an Exception
-        with self.assertRaisesRegex(Exception, 'Failed to get initial route from OpenRouteService'):
-             self.planner._get_initial_route(self.start_coords, self.end_coords)
+                # Assert that the session get was called
+                self.mock_get.assert_called_once()
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
-        # Assert that raise_for_status was called
-        mock_response.raise_for_status.assert_called_once()
+    def test_get_initial_route_cached(self):
+        """Test a route is requested once and served from the cache for nearby coordinates."""
+        self.mock_get.return_value = FakeResponse(ORS_OK)
 
+        first = self.planner._get_initial_route(self.start_coords, self.end_coords)
+        # Differs only beyond the cache precision (about 11 meters)
+        nearby_start = [self.start_coords[0] + 0.00001, self.start_coords[1]]
+        second = self.planner._get_initial_route(nearby_start, self.end_coords)
 
-    @patch('requests.get')
-    def test_get_initial_route_request_exception(self, mock_get):
-        """Test API call raising a requests.exceptions.RequestException (e.g., network error)."""
-        # Configure the mock requests.get to raise a RequestException
-        mock_get.side_effect = RequestException("Network is unreachable")
+        self.mock_get.assert_called_once()
+        self.assertEqual(first[0].tolist(), second[0].tolist())
+        self.assertEqual(first[1:], second[1:])
 
-        # Assert that calling the method raises an Exception
-        with self.assertRaisesRegex(Exception, 'Failed to get initial route from OpenRouteService'):
-             self.planner._get_initial_route(self.start_coords, self.end_coords)
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
+    def test_get_initial_route_failure_not_cached(self):
+        """Test a failed route request is retried on the next call."""
+        self.mock_get.side_effect = NETWORK_ERROR
 
+        for _ in range(2):
+            with self.assertRaises(RoutePlanError):
+                self.planner._get_initial_route(self.start_coords, self.end_coords)
 
-    @patch('requests.get')
-    def test_get_initial_route_empty_features(self, mock_get):
-        """Test API call returning a response with no features."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.raise_for_status.return_value = None
-        mock_response.json.return_value = {
-            "features": [] # Empty features list
-        }
-        mock_get.return_value = mock_response
+        self.assertEqual(self.mock_get.call_count, 2)
 
-        # Assert that calling the method raises an Exception due to missing features
-        with self.assertRaisesRegex(Exception, 'No route features found in initial route response'):
-             self.planner._get_initial_route(self.start_coords, self.end_coords)
+@patch('routeplanner.services.route_planner.find_stops', return_value=[])
+@patch.object(RoutePlanner, '_get_initial_route', return_value=(np.array(ORS_ROUTE_COORDS, dtype=np.float32), 350000, 12600))
+class RoutePlannerPlanCacheTests(unittest.TestCase):
+    """Tests for caching planned results."""
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
+    def setUp(self):
+        """Start every test with an empty cache."""
+        caches['default'].clear()
 
+    def test_plan_cached_for_nearby_coordinates(self, mock_get_initial_route, mock_find_stops):
+        """Test a plan is computed once and served from the cache for nearby coordinates."""
+        first = RoutePlanner(START_COORDS, END_COORDS).plan()
+        # Differs only beyond the cache precision (about 11 meters)
+        second = RoutePlanner([START_COORDS[0] + 0.00001, START_COORDS[1]], END_COORDS).plan()
 
-    @patch('requests.get')
-    def test_get_initial_route_missing_geometry(self, mock_get):
-        """Test API call returning a response missing geometry."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.raise_for_status.return_value = None
-        # Simulate a response missing the geometry key
-        mock_response.json.return_value = {
-            "features": [{
-                "properties": {"summary": {"distance": 350000, "duration": 12600}}
-            }]
-        }
-        mock_get.return_value = mock_response
+        mock_get_initial_route.assert_called_once()
+        mock_find_stops.assert_called_once()
+        self.assertEqual(first, second)
 
-        # Assert that calling the method raises an Exception (e.g., KeyError)
-        with self.assertRaises(Exception) as cm: # Catch generic Exception or specific KeyError
-             self.planner._get_initial_route(self.start_coords, self.end_coords)
+    def test_plan_cached_per_geometry_format(self, mock_get_initial_route, mock_find_stops):
+        """Test plans in different geometry formats are cached separately."""
+        planner = RoutePlanner(START_COORDS, END_COORDS)
 
-        # Check if the exception message indicates a processing error
-        self.assertIn('Error processing OpenRouteService initial route response', str(cm.exception))
+        latlon = planner.plan()
+        polyline = planner.plan(geometry_format='polyline')
 
+        self.assertEqual(mock_get_initial_route.call_count, 2)
+        self.assertIsInstance(latlon['route_geometry'], list)
+        self.assertIsInstance(polyline['route_geometry'], str)
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
+    def test_plan_error_not_cached(self, mock_get_initial_route, mock_find_stops):
+        """Test a failed plan is retried on the next call."""
+        mock_get_initial_route.side_effect = RoutePlanError('Failed to get initial route from OpenRouteService')
+        planner = RoutePlanner(START_COORDS, END_COORDS)
 
+        for _ in range(2):
+            with self.assertRaises(RoutePlanError):
+                planner.plan()
 
-    @patch('requests.get')
-    def test_get_initial_route_missing_summary(self, mock_get):
-        """Test API call returning a response missing summary."""
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.raise_for_status.return_value = None
-        # Simulate a response missing the summary key
-        mock_response.json.return_value = {
-            "features": [{
-                "geometry": {"coordinates": [[-74.0, 40.7], [-75.0, 39.8], [-77.0, 38.9]]},
-            }]
-        }
-        mock_get.return_value = mock_response
+        self.assertEqual(mock_get_initial_route.call_count, 2)
 
-        # Assert that calling the method raises an Exception (e.g., KeyError)
-        with self.assertRaises(Exception) as cm: # Catch generic Exception or specific KeyError
-             self.planner._get_initial_route(self.start_coords, self.end_coords)
 
-        # Check if the exception message indicates a processing error
-        self.assertIn('Error processing OpenRouteService initial route response', str(cm.exception))
-
-
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
-
-@override_settings(NOMINATIM_USER_AGENT="fake_test_user_agent")
-class GasStationEnricherServiceTests(TestCase):
+class RoutePlannerFuelCostTests(unittest.TestCase):
+    """Tests for the fuel cost calculation along the initial route."""
 
-    def setUp(self):
-        """Set up a service instance for each test."""
-        self.service = GasStationEnricherService()
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.planner = RoutePlanner([-74.0, 40.0], [-74.0, 43.0])
+        cls.route_coords = np.array([[-74.0, 40.0], [-74.0, 41.0], [-74.0, 42.0], [-74.0, 43.0]])
+        cls.cumulative_distances = [0, 100, 200, 300]
+
+    def _cost(self, optimal_stops):
+        return self.planner._calculate_total_fuel_cost_on_route(
+            self.route_coords, 300, optimal_stops, self.cumulative_distances
+        )
+
+    def test_cost_without_stops(self):
+        """Test the whole route is priced at the default price without stops."""
+        self.assertAlmostEqual(self._cost([]), 300 / 10 * 3.00)
+
+    def test_cost_with_one_stop(self):
+        """Test the route after a single stop is priced at that stop's price."""
+        stops = [{'location': [41.0, -74.0], 'fuel_price_per_gallon': 4.00}]
+        self.assertAlmostEqual(self._cost(stops), 100 / 10 * 3.00 + 200 / 10 * 4.00)
+
+    def test_cost_with_several_stops(self):
+        """Test each segment is priced at the stop it starts from."""
+        stops = [
+            {'location': [41.0, -74.0], 'fuel_price_per_gallon': 4.00},
+            {'location': [42.0, -74.0], 'fuel_price_per_gallon': 2.00},
+        ]
+        self.assertAlmostEqual(self._cost(stops), 100 / 10 * 3.00 + 100 / 10 * 4.00 + 100 / 10 * 2.00)
+
+
+class BuildFullAddressTests(unittest.TestCase):
+    """Tests for building the geocoded address of a gas station."""
+
+    def test_build_full_address(self):
+        """Test address parts are stripped, joined, suffixed with the country and normalized."""
+        self.assertEqual(build_full_address(' I-44,  EXIT 283 ', 'Big Cabin', 'OK'), 'i-44, exit 283, big cabin, ok, usa')
+
+    def test_build_full_address_skips_empty_parts(self):
+        """Test empty parts are left out and a station without any parts has no address."""
+        self.assertEqual(build_full_address('', 'Tomah', ' '), 'tomah, usa')
+        self.assertEqual(build_full_address('', ' ', ''), '')
+
+
+class GasStationEnricherServiceTests(PatchedSessionGetMixin, unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up one service instance shared by every test, it holds no per-call state."""
+        # Settings are overridden in setUpModule, so the session picks up the test User-Agent.
+        # Built before super().setUpClass(), which patches the service's own session.
+        cls.service = GasStationEnricherService()
+        cls.patched_session_owner = cls.service
         # Define a test address
-        self.test_address = "1600 Amphitheatre Parkway, Mountain View, CA"
+        cls.test_address = "1600 Amphitheatre Parkway, Mountain View, CA"
+        super().setUpClass()
+
+    def setUp(self):
+        """Start every test with an empty geocode cache."""
+        super().setUp()
+        caches['geocode'].clear()
+
+    def _assert_nominatim_call(self, address):
+        """Asserts the address was geocoded with exactly one request."""
+        self.mock_get.assert_called_once_with(
+            GasStationEnricherService.NOMINATIM_SEARCH_URL,
+            params={**EXPECTED_NOMINATIM_PARAMS, 'q': address},
+            timeout=10, # Assert the timeout is passed
+        )
 
-    @patch('requests.get') # Patch requests.get for this test method
-    def test_geocode_address_success(self, mock_get):
+    def test_geocode_address_success(self):
         """Test successful geocoding of an address."""
-        # Configure the mock requests.get to return a successful response
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.raise_for_status.return_value = None # Simulate no HTTP errors
-        # Simulate a successful Nominatim JSON response structure as expected by the service
-        mock_response.json.return_value = [
-            {
-                "lat": "37.4220", # Nominatim returns lat/lon as strings
-                "lon": "-122.0840",
-                "display_name": "Googleplex, Mountain View, CA, USA"
-            }
-        ]
-        mock_get.return_value = mock_response
+        # Configure the mocked session get to return a successful response
+        self.mock_get.return_value = FakeResponse(NOMINATIM_OK)
 
         # Call the method being tested
         coords = self.service.geocode_address(self.test_address)
 
-        # Assert that requests.get was called with the correct URL, parameters, and headers
-        expected_url = self.service.NOMINATIM_SEARCH_URL
-        expected_params = {
-            'q': self.test_address,
-            'format': 'json',
-            'limit': 1,
-        }
-        expected_headers = {
-            'User-Agent': 'fake_test_user_agent' # Should use the overridden setting
-        }
-        mock_get.assert_called_once_with(
-            expected_url,
-            params=expected_params,
-            headers=expected_headers,
-            timeout=10 # Assert the timeout is passed
-        )
+        # Assert that the session get was called with the correct URL, parameters and timeout
+        self._assert_nominatim_call(self.test_address)
+        # The User-Agent is sent by the session on every request
+        self.assertEqual(self.service.session.headers['User-Agent'], 'fake_test_user_agent') # Should use the overridden setting
+        self.assertIn('gzip', self.service.session.headers['Accept-Encoding']) # Compressed responses are requested
 
         # Assert that the method returned the correct coordinates as floats
         self.assertEqual(coords, (37.4220, -122.0840))
 
 
-    @patch('requests.get')
-    def test_geocode_address_no_results(self, mock_get):
+    def test_geocode_address_no_results(self):
         """Test geocoding an address that returns no results."""
-        # Configure the mock requests.get to return a response with no results
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.raise_for_status.return_value = None
-        mock_response.json.return_value = [] # Simulate an empty results list
-        mock_get.return_value = mock_response
+        # Configure the mocked session get to return a response with no results
+        self.mock_get.return_value = FakeResponse([]) # Simulate an empty results list
 
         # Call the method being tested
         coords = self.service.geocode_address(self.test_address)
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
+        # Assert that the session get was called
+        self.mock_get.assert_called_once()
 
         # Assert that the method returned None
         self.assertIsNone(coords)
 
 
-    @patch('requests.get')
-    def test_geocode_address_http_error(self, mock_get):
-        """Test API call returning an HTTP error (e.g., 403, 404, 500)."""
-        # Configure the mock requests.get to raise an HTTPError
-        mock_response = MagicMock()
-        mock_response.status_code = 403 # Example: Forbidden
-        # Simulate raise_for_status() raising an HTTPError
-        mock_response.raise_for_status.side_effect = HTTPError("Forbidden", response=mock_response)
-        mock_get.return_value = mock_response
+    def test_geocode_address_errors(self):
+        """Test each way the API call can fail re-raises a requests exception."""
+        cases = [
+            # HTTP error (e.g., 403, 404, 500) raised by raise_for_status(), re-raised as a RequestException
+            ('http_error', {'return_value': FakeResponse(status_code=403, raise_exc=FORBIDDEN_ERROR)}, RequestException),
+            # requests.exceptions.RequestException (e.g., network error)
+            ('request_exception', {'side_effect': NETWORK_ERROR}, RequestException),
+            ('timeout', {'side_effect': TIMEOUT_ERROR}, Timeout),
+        ]
+        for name, mock_config, expected_exception in cases:
+            with self.subTest(name):
+                self.mock_get.reset_mock(return_value=True, side_effect=True)
+                self.mock_get.configure_mock(**mock_config)
+
+                with self.assertRaises(expected_exception):
+                    self.service.geocode_address(self.test_address)
+
+                # Assert that the session get was called
+                self.mock_get.assert_called_once()
+
+
+    def test_geocode_address_cache_hit(self):
+        """Test a cached address is returned without calling Nominatim, regardless of case and spacing."""
+        store_cached_geocode(self.test_address, (37.4220, -122.0840))
+
+        coords = self.service.geocode_address("  1600 amphitheatre   Parkway, Mountain View, CA ")
+
+        self.mock_get.assert_not_called()
+        self.assertEqual(coords, (37.4220, -122.0840))
+
+
+    def test_geocode_address_caches_no_results(self):
+        """Test an address without results is cached so it is not requested again."""
+        self.mock_get.return_value = FakeResponse([])
+
+        self.assertIsNone(self.service.geocode_address(self.test_address))
+        self.assertIsNone(self.service.geocode_address(self.test_address))
+
+        # Only the first lookup reaches Nominatim
+        self.mock_get.assert_called_once()
+
+
+class _FakeAiohttpResponse:
+    """Minimal stand-in for an aiohttp response used as an async context manager."""
+
+    def __init__(self, data):
+        self._data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        return None
+
+    async def json(self):
+        return self._data
+
+
+class _FakeAiohttpSession:
+    """Minimal stand-in for an aiohttp session that records its get() calls."""
+
+    def __init__(self, response):
+        self.response = response
+        self.get_calls = []
+
+    def get(self, url, **kwargs):
+        self.get_calls.append((url, kwargs))
+        return self.response
+
+
+class AsyncEnricherTests(unittest.TestCase):
+
+    def setUp(self):
+        """Start every test with an empty geocode cache."""
+        caches['geocode'].clear()
+
+    @patch('routeplanner.services.async_enricher.asyncio.sleep', new_callable=AsyncMock)
+    def test_geocode_one_success(self, mock_sleep):
+        """Test a single async geocode parses the response and waits after the request."""
+        session = _FakeAiohttpSession(_FakeAiohttpResponse(NOMINATIM_OK))
+
+        coords = asyncio.run(_geocode_one(session, "Some address", asyncio.Semaphore(1)))
+
+        self.assertEqual(session.get_calls, [(
+            GasStationEnricherService.NOMINATIM_SEARCH_URL,
+            {'params': {'q': "Some address", 'format': 'json', 'limit': 1}},
+        )])
+        mock_sleep.assert_awaited_once_with(1.0)
+        self.assertEqual(coords, (37.4220, -122.0840))
+
+
+    @patch('routeplanner.services.async_enricher._geocode_one', new_callable=AsyncMock)
+    def test_geocode_many_deduplicates_addresses(self, mock_geocode_one):
+        """Test each distinct address is geocoded exactly once."""
+        mock_geocode_one.return_value = (1.0, 2.0)
+
+        results = asyncio.run(geocode_many(["Addr A", "Addr B", "Addr A"]))
+
+        self.assertEqual(mock_geocode_one.await_count, 2)
+        self.assertEqual(results, {"Addr A": (1.0, 2.0), "Addr B": (1.0, 2.0)})
 
-        # Assert that calling the method re-raises a RequestException (as per the service's current implementation)
-        with self.assertRaises(RequestException):
-             self.service.geocode_address(self.test_address)
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
-        # Assert that raise_for_status was called (this is called internally before the exception is caught and re-raised)
-        mock_response.raise_for_status.assert_called_once()
+    @patch('routeplanner.services.async_enricher._geocode_one', new_callable=AsyncMock)
+    def test_geocode_many_returns_exceptions(self, mock_geocode_one):
+        """Test a failing address does not abort the batch and its error is returned."""
+        error = NETWORK_ERROR
+        mock_geocode_one.side_effect = lambda session, address, limiter: self._raise_for(address, error)
 
+        results = asyncio.run(geocode_many(["Good", "Bad"]))
 
-    @patch('requests.get')
-    def test_geocode_address_request_exception(self, mock_get):
-        """Test API call raising a requests.exceptions.RequestException (e.g., network error)."""
-        # Configure the mock requests.get to raise a RequestException
-        mock_get.side_effect = RequestException("Network is unreachable")
+        self.assertEqual(results["Good"], (1.0, 2.0))
+        self.assertIs(results["Bad"], error)
 
-        # Assert that calling the method re-raises the RequestException
-        with self.assertRaises(RequestException):
-             self.service.geocode_address(self.test_address)
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
+    @patch('routeplanner.services.async_enricher._geocode_one', new_callable=AsyncMock)
+    def test_geocode_many_uses_cache(self, mock_geocode_one):
+        """Test cached addresses are skipped and new results are cached for the next import."""
+        store_cached_geocode("Cached", (3.0, 4.0))
+        mock_geocode_one.return_value = (1.0, 2.0)
 
+        results = asyncio.run(geocode_many(["Cached", "New"]))
+        self.assertEqual(results, {"Cached": (3.0, 4.0), "New": (1.0, 2.0)})
+        mock_geocode_one.assert_awaited_once()
 
-    @patch('requests.get')
-    def test_geocode_address_timeout(self, mock_get):
-        """Test API call raising a requests.exceptions.Timeout."""
-        # Configure the mock requests.get to raise a Timeout
-        mock_get.side_effect = Timeout("Request timed out")
+        # A second run is served entirely from the cache
+        mock_geocode_one.reset_mock()
+        results = asyncio.run(geocode_many(["Cached", "New"]))
+        self.assertEqual(results, {"Cached": (3.0, 4.0), "New": (1.0, 2.0)})
+        mock_geocode_one.assert_not_awaited()
 
-        # Assert that calling the method re-raises the Timeout exception
-        with self.assertRaises(Timeout):
-             self.service.geocode_address(self.test_address)
 
-        # Assert that requests.get was called
-        mock_get.assert_called_once()
+    @staticmethod
+    def _raise_for(address, error):
+        if address == "Bad":
+            raise error
+        return (1.0, 2.0)
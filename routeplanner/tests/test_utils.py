@@ -1,15 +1,26 @@
 import unittest
-from unittest.mock import patch, MagicMock
-from django.test import TestCase
-from django.db.models import F
-from django.conf import settings 
+from bisect import bisect_left
+import numpy as np
+from unittest.mock import patch
+from django.test import SimpleTestCase, TestCase
 
 from routeplanner.utils import (
     haversine,
+    haversine_vec,
+    route_segment_lengths,
     calculate_cumulative_distances,
     find_route_point_index_by_distance,
+    find_nearest_route_point_indices,
+    bounding_box,
+    build_route_extent_tables,
+    build_route_point_radians,
+    route_window_bounding_box,
+    encode_polyline,
+    get_station_arrays,
+    clear_station_arrays,
     find_candidate_stations_near_segment,
     select_cheapest_stop,
+    deduplicate_stops_by_location,
     find_stops
 )
 from routeplanner.models import GasStation 
@@ -41,6 +52,61 @@ class HaversineTests(unittest.TestCase):
         distance = haversine(coord1, coord2)
         self.assertAlmostEqual(distance, 12428.0, delta=50.0)
 
+    def test_haversine_vec_keeps_float32(self):
+        """Test float32 inputs are computed in float32 and mixed inputs in float64."""
+        lons = np.array([-74.0060, -77.0369], dtype=np.float32)
+        lats = np.array([40.7128, 38.9072], dtype=np.float32)
+
+        single = haversine_vec(lons[0], lats[0], lons, lats)
+        mixed = haversine_vec(-74.0060, 40.7128, lons.astype(np.float64), lats.astype(np.float64))
+
+        self.assertEqual(single.dtype, np.float32)
+        self.assertEqual(mixed.dtype, np.float64)
+        np.testing.assert_allclose(single, mixed, atol=0.01)
+
+    def test_haversine_vec_float32_error_bound(self):
+        """Test float32 station-to-route distances across the continent stay within 0.1 mile of float64."""
+        # A New York to Los Angeles line of route points against a grid of stations over the US
+        route_lons = np.linspace(-74.0060, -118.2437, 500)
+        route_lats = np.linspace(40.7128, 34.0522, 500)
+        station_lons, station_lats = (grid.ravel() for grid in np.meshgrid(np.linspace(-124, -67, 40), np.linspace(25, 49, 20)))
+
+        single = haversine_vec(
+            station_lons[:, None].astype(np.float32), station_lats[:, None].astype(np.float32),
+            route_lons[None, :].astype(np.float32), route_lats[None, :].astype(np.float32)
+        )
+        double = haversine_vec(station_lons[:, None], station_lats[:, None], route_lons[None, :], route_lats[None, :])
+
+        self.assertLess(np.abs(single.astype(np.float64) - double).max(), 0.1)
+
+    def test_haversine_vec_matches_scalar(self):
+        """Test the vectorized haversine matches the scalar version and broadcasts."""
+        points = [(-74.0060, 40.7128), (-77.0369, 38.9072), (0, 0), (180, 0)]
+        lons = np.array([p[0] for p in points])
+        lats = np.array([p[1] for p in points])
+        distances = haversine_vec(lons[:, None], lats[:, None], lons[None, :], lats[None, :])
+        self.assertEqual(distances.shape, (4, 4))
+        for i, coord1 in enumerate(points):
+            for j, coord2 in enumerate(points):
+                self.assertAlmostEqual(distances[i, j], haversine(coord1, coord2), places=6)
+
+
+class RouteSegmentLengthsTests(unittest.TestCase):
+    """Tests for the consecutive segment lengths kernel."""
+
+    def test_route_segment_lengths_matches_haversine_vec(self):
+        """Test each segment length equals haversine_vec between its two end points."""
+        route = np.array([(-74.0, 40.0), (-74.3, 40.4), (-75.1, 40.9), (179.9, -10.0), (-179.9, -10.2)])
+
+        lengths = route_segment_lengths(route)
+
+        expected = haversine_vec(route[:-1, 0], route[:-1, 1], route[1:, 0], route[1:, 1])
+        np.testing.assert_allclose(lengths, expected, rtol=1e-12)
+
+    def test_route_segment_lengths_single_point(self):
+        """Test a single point route has no segments."""
+        self.assertEqual(len(route_segment_lengths(np.array([(-74.0, 40.0)]))), 0)
+
 
 class CalculateCumulativeDistancesTests(unittest.TestCase):
     """Tests for calculating cumulative distances along a route."""
@@ -78,6 +144,42 @@ class CalculateCumulativeDistancesTests(unittest.TestCase):
         cumulative = calculate_cumulative_distances(route_coords, total_distance)
         self.assertEqual(cumulative, [0])
 
+    def test_calculate_cumulative_distances_without_total(self):
+        """Test the total distance is optional and the last value is then left as measured."""
+        route_coords = [(-74.0, 40.0), (-74.1, 40.1), (-74.2, 40.2)]
+        expected_total = haversine(route_coords[0], route_coords[1]) + haversine(route_coords[1], route_coords[2])
+
+        cumulative = calculate_cumulative_distances(route_coords)
+
+        self.assertAlmostEqual(cumulative[-1], expected_total, places=9)
+
+    def test_calculate_cumulative_distances_matches_scalar_haversine(self):
+        """Test the vectorized segment lengths agree with summing haversine per segment."""
+        route_coords = [(-74.0, 40.0), (-74.3, 40.4), (-75.1, 40.9), (-76.0, 41.0), (-76.2, 41.8)]
+        expected = [0]
+        for previous, current in zip(route_coords, route_coords[1:]):
+            expected.append(expected[-1] + haversine(previous, current))
+
+        cumulative = calculate_cumulative_distances(route_coords, expected[-1])
+
+        for value, expected_value in zip(cumulative, expected):
+            self.assertAlmostEqual(value, expected_value, places=9)
+
+
+    def test_calculate_cumulative_distances_float32_route(self):
+        """Test a float32 route of about 5000 miles stays within 0.01% of the float64 distance."""
+        # A zigzag towards the northwest, one vertex roughly every 3 miles
+        steps = np.arange(2100)
+        route_coords = np.column_stack((-70.0 - steps * 0.039, 25.0 + steps * 0.012 + (steps % 2) * 0.01))
+        expected = sum(haversine(previous, current) for previous, current in zip(route_coords[:-1], route_coords[1:]))
+
+        cumulative = calculate_cumulative_distances(route_coords.astype(np.float32), expected)
+
+        # The final value is snapped to the total distance, so check the vertex before it
+        expected_before_last = expected - haversine(route_coords[-2], route_coords[-1])
+        self.assertGreater(expected, 4800)
+        self.assertAlmostEqual(cumulative[-2] / expected_before_last, 1.0, delta=1e-4)
+
 
 class FindRoutePointIndexByDistanceTests(unittest.TestCase):
     """Tests for finding route point index by distance."""
@@ -119,6 +221,93 @@ class FindRoutePointIndexByDistanceTests(unittest.TestCase):
         index = find_route_point_index_by_distance(cumulative_distances, target_distance, start_index=start_index)
         self.assertEqual(index, 3)
 
+    def test_find_index_numpy_array(self):
+        """Test NumPy cumulative distances give the same indices as a list."""
+        cumulative_distances = [0, 10, 25, 40, 60]
+        for target_distance, start_index in [(0, 0), (25, 0), (30, 0), (40, 2), (5, 3), (70, 0)]:
+            with self.subTest(target_distance=target_distance, start_index=start_index):
+                self.assertEqual(
+                    find_route_point_index_by_distance(np.array(cumulative_distances, dtype=np.float64), target_distance, start_index),
+                    find_route_point_index_by_distance(cumulative_distances, target_distance, start_index)
+                )
+
+    def test_find_index_target_behind_start_index(self):
+        """Test a target already passed before start_index returns start_index."""
+        cumulative_distances = [0, 10, 25, 40, 60]
+        index = find_route_point_index_by_distance(cumulative_distances, 5, start_index=3)
+        self.assertEqual(index, 3)
+
+
+class FindNearestRoutePointIndicesTests(unittest.TestCase):
+    """Tests for matching locations to their closest route point."""
+
+    def setUp(self):
+        self.route_coords = [(-74.0, 40.0), (-74.5, 40.5), (-75.0, 41.0), (-75.5, 41.5)] # [lon, lat]
+
+    def test_matches_brute_force_haversine(self):
+        """Test the vectorized search agrees with a scalar haversine scan."""
+        locations = [[40.1, -74.1], [41.4, -75.4], [40.9, -74.8]] # [lat, lon]
+        indices = find_nearest_route_point_indices(self.route_coords, locations)
+
+        for location, index in zip(locations, indices):
+            distances = [haversine((location[1], location[0]), point) for point in self.route_coords]
+            self.assertEqual(index, distances.index(min(distances)))
+
+    def test_location_on_route_point(self):
+        """Test a location lying on a route point maps to that point."""
+        indices = find_nearest_route_point_indices(self.route_coords, [[41.0, -75.0]])
+        self.assertEqual(indices.tolist(), [2])
+
+    def test_blocked_search_matches_single_block(self):
+        """Test splitting the locations into blocks does not change the result."""
+        locations = [[40.1, -74.1], [41.4, -75.4], [40.9, -74.8], [40.4, -74.6], [41.1, -75.2]]
+        expected = find_nearest_route_point_indices(self.route_coords, locations)
+        blocked = find_nearest_route_point_indices(self.route_coords, locations, block_elements=len(self.route_coords) * 2)
+        self.assertEqual(blocked.tolist(), expected.tolist())
+
+
+class BoundingBoxTests(unittest.TestCase):
+    """Tests for the segment bounding box used to pre-filter stations."""
+
+    def test_bounding_box_contains_points_within_margin(self):
+        """Test no point within the margin of the route points can fall outside the box."""
+        coords = [(-74.1, 40.1), (-74.2, 40.2)]
+        margin = 15
+        lat_min, lat_max, lon_min, lon_max = bounding_box(coords, margin)
+
+        # Every edge lies at least the margin away from the nearest route point
+        self.assertGreaterEqual(haversine((-74.2, lat_max), (-74.2, 40.2)), margin)
+        self.assertGreaterEqual(haversine((-74.1, lat_min), (-74.1, 40.1)), margin)
+        self.assertGreaterEqual(haversine((lon_min, 40.2), (-74.2, 40.2)), margin)
+        self.assertGreaterEqual(haversine((lon_max, 40.1), (-74.1, 40.1)), margin)
+
+    def test_route_window_bounding_box_matches_bounding_box(self):
+        """Test boxes read from the extent tables equal boxes computed from the window's points."""
+        rng = np.random.default_rng(0)
+        route_coords = np.column_stack((rng.uniform(-80, -70, 13), rng.uniform(-5, 45, 13)))
+        tables = build_route_extent_tables(route_coords)
+
+        for start_index in range(len(route_coords)):
+            for end_index in range(start_index, len(route_coords)):
+                with self.subTest(start_index=start_index, end_index=end_index):
+                    self.assertEqual(
+                        route_window_bounding_box(tables, start_index, end_index, 10),
+                        bounding_box(route_coords[start_index:end_index + 1].tolist(), 10)
+                    )
+
+
+class EncodePolylineTests(unittest.TestCase):
+    """Tests for the encoded polyline route geometry format."""
+
+    def test_encode_polyline_reference_example(self):
+        """Test against the example from Google's encoded polyline algorithm documentation."""
+        latlon_coords = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+        self.assertEqual(encode_polyline(latlon_coords), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    def test_encode_polyline_empty(self):
+        """Test an empty geometry encodes to an empty string."""
+        self.assertEqual(encode_polyline([]), '')
+
 
 class SelectCheapestStopTests(unittest.TestCase):
     """Tests for selecting the cheapest fuel stop from a list."""
@@ -146,122 +335,262 @@ class SelectCheapestStopTests(unittest.TestCase):
         self.assertEqual(cheapest['fuel_price_per_gallon'], 3.10)
 
 
-# Patch haversine for simplicity in this test class
-@patch('routeplanner.utils.haversine', side_effect=lambda c1, c2: 10)
+class DeduplicateStopsByLocationTests(unittest.TestCase):
+    """Tests for removing repeated fuel stops."""
+
+    def test_first_stop_per_location_kept_in_order(self):
+        """Test the first stop at each location is kept and the original order preserved."""
+        stops = [
+            {'location': [40.1, -74.1], 'distance_from_start_miles': 10},
+            {'location': [40.2, -74.2], 'distance_from_start_miles': 20},
+            {'location': [40.1, -74.1], 'distance_from_start_miles': 30},
+            {'location': [40.3, -74.3], 'distance_from_start_miles': 40},
+        ]
+
+        deduplicated = deduplicate_stops_by_location(stops)
+
+        self.assertEqual([stop['distance_from_start_miles'] for stop in deduplicated], [10, 20, 40])
+
+
 class FindCandidateStationsNearSegmentTests(TestCase):
     """
     Tests for finding candidate gas stations near a route segment.
     Requires a database and GasStation model.
     """
 
+    @classmethod
+    def setUpTestData(cls):
+        """Create some dummy GasStation instances once for the whole class."""
+        # Create stations with and without coordinates, in one INSERT
+        stations = GasStation.objects.bulk_create([
+            GasStation(
+                opis_truckstop_id='1', truckstop_name='Station 1', address='Addr 1',
+                city='City 1', state='S1', rack_id='R1', retail_price=3.00,
+                latitude=40.0, longitude=-74.0 # At the route start, behind the last stop
+            ),
+            GasStation(
+                opis_truckstop_id='2', truckstop_name='Station 2', address='Addr 2',
+                city='City 2', state='S2', rack_id='R2', retail_price=3.10,
+                latitude=40.1, longitude=-74.1
+            ),
+            GasStation(
+                opis_truckstop_id='3', truckstop_name='Station 3', address='Addr 3',
+                city='City 3', state='S3', rack_id='R3', retail_price=3.20,
+                latitude=None, longitude=None # Station without coordinates
+            ),
+            GasStation(
+                opis_truckstop_id='4', truckstop_name='Station 4', address='Addr 4',
+                city='City 4', state='S4', rack_id='R4', retail_price=2.90,
+                latitude=40.5, longitude=-74.5 # Outside the segment's bounding box
+            ),
+            GasStation(
+                opis_truckstop_id='5', truckstop_name='Station 5', address='Addr 5',
+                city='City 5', state='S5', rack_id='R5', retail_price=2.80,
+                latitude=39.9, longitude=-74.45 # Inside the bounding box, but over 20 miles from the segment
+            ),
+            GasStation(
+                opis_truckstop_id='6', truckstop_name='Station 6', address='Addr 6',
+                city='City 6', state='S6', rack_id='R6', retail_price=3.30,
+                latitude=40.25, longitude=-74.25
+            ),
+        ])
+        cls.station1, cls.station2, cls.station3, cls.station4, cls.station5, cls.station6 = stations
+
+        # Define a route segment and parameters
+        cls.route_coords = [(-74.0, 40.0), (-74.1, 40.1), (-74.2, 40.2), (-74.3, 40.3)]
+        cls.cumulative_distances = [0, 10, 20, 30] # Dummy cumulative distances
+        cls.segment_start_index = 1 # Segment from index 1 to 2
+        cls.segment_end_index = 2
+        cls.proximity_threshold_miles = 15 # Threshold for being near the route point
+        cls.last_stop_distance_from_start = 5 # Assume last stop was at distance 5
+
     def setUp(self):
-        """Create some dummy GasStation instances for testing."""
-        # Create stations with and without coordinates
-        self.station1 = GasStation.objects.create(
-            opis_truckstop_id='1', truckstop_name='Station 1', address='Addr 1',
-            city='City 1', state='S1', rack_id='R1', retail_price=3.00,
-            latitude=40.0, longitude=-74.0
-        )
-        self.station2 = GasStation.objects.create(
-            opis_truckstop_id='2', truckstop_name='Station 2', address='Addr 2',
-            city='City 2', state='S2', rack_id='R2', retail_price=3.10,
-            latitude=40.1, longitude=-74.1
-        )
-        self.station3 = GasStation.objects.create(
-            opis_truckstop_id='3', truckstop_name='Station 3', address='Addr 3',
-            city='City 3', state='S3', rack_id='R3', retail_price=3.20,
-            latitude=None, longitude=None # Station without coordinates
-        )
-        self.station4 = GasStation.objects.create(
-             opis_truckstop_id='4', truckstop_name='Station 4', address='Addr 4',
-             city='City 4', state='S4', rack_id='R4', retail_price=2.90,
-             latitude=40.5, longitude=-74.5 # Station potentially far from the route segment
+        # Rolling back a test's writes sends no signals, so drop arrays it may have loaded
+        clear_station_arrays()
+
+    def _find_candidates(self, **overrides):
+        params = {
+            'proximity_threshold_miles': self.proximity_threshold_miles,
+            'last_stop_distance_from_start': self.last_stop_distance_from_start,
+        }
+        params.update(overrides)
+        return find_candidate_stations_near_segment(
+            self.route_coords, self.cumulative_distances,
+            self.segment_start_index, self.segment_end_index,
+            params['proximity_threshold_miles'], params['last_stop_distance_from_start']
         )
 
-        # Define a dummy route segment and parameters
-        self.route_coords = [(-74.0, 40.0), (-74.1, 40.1), (-74.2, 40.2), (-74.3, 40.3)]
-        self.cumulative_distances = [0, 10, 20, 30] # Dummy cumulative distances
-        self.segment_start_index = 1 # Segment from index 1 to 2
-        self.segment_end_index = 2
-        self.proximity_threshold_miles = 15 # Threshold for being near the route point
-        self.last_stop_distance_from_start = 5 # Assume last stop was at distance 5
-
-    def test_find_candidate_stations_near_segment_found(self, mock_haversine):
-        """Test finding stations near the segment."""
-        # Configure mock_haversine's side_effect to control distances returned
-        # haversine is called between station_coords and route_point_coords[k] for proximity
-        # and between station_coords and route_coords[0] for the "ahead" check.
-        def mock_haversine_side_effect(coord1, coord2):
-            # Simulate proximity check: return 10 (within threshold 15) for station1/2, 30 (above threshold) for station4
-            if coord2 in self.route_coords[self.segment_start_index : self.segment_end_index + 1]:
-                 if coord1 in [(float(self.station1.longitude), float(self.station1.latitude)),
-                               (float(self.station2.longitude), float(self.station2.latitude))]:
-                     return 10
-                 if coord1 == (float(self.station4.longitude), float(self.station4.latitude)):
-                      return 30
-            # Simulate "ahead" check from route_coords[0]: return > last_stop_distance_from_start (5) for station1/2, < 5 for station4
-            if coord2 == self.route_coords[0]:
-                 if coord1 == (float(self.station1.longitude), float(self.station1.latitude)):
-                     return 8 # Ahead
-                 if coord1 == (float(self.station2.longitude), float(self.station2.latitude)):
-                     return 12 # Ahead
-                 if coord1 == (float(self.station4.longitude), float(self.station4.latitude)):
-                      return 4 # Not ahead
-            return 10 # Default for other haversine calls if any
-
-        mock_haversine.side_effect = mock_haversine_side_effect
+    def test_find_candidate_stations_near_segment_found(self):
+        """Test finding stations near the segment and ahead of the last stop."""
+        candidates = self._find_candidates()
 
+        candidate_opis_ids = {c['opis_truckstop_id'] for c in candidates}
+        self.assertEqual(candidate_opis_ids, {self.station2.opis_truckstop_id, self.station6.opis_truckstop_id})
+        self.assertNotIn(self.station1.opis_truckstop_id, candidate_opis_ids) # Not ahead of last stop
+        self.assertNotIn(self.station3.opis_truckstop_id, candidate_opis_ids) # No coordinates
+        self.assertNotIn(self.station5.opis_truckstop_id, candidate_opis_ids) # Too far from the segment
+
+        station2_candidate = next(c for c in candidates if c['opis_truckstop_id'] == self.station2.opis_truckstop_id)
+        self.assertEqual(station2_candidate['location'], [40.1, -74.1])
+        self.assertEqual(station2_candidate['fuel_price_per_gallon'], 3.10)
+        self.assertAlmostEqual(
+            station2_candidate['distance_from_start_straight_line_miles'],
+            haversine(self.route_coords[0], (-74.1, 40.1)), delta=0.001 # Searched in float32
+        )
+        self.assertIsInstance(station2_candidate['distance_from_start_straight_line_miles'], float)
+
+    def test_find_candidate_stations_with_precomputed_distances_from_start(self):
+        """Test passing every station's distance from the route start gives the same candidates."""
+        stations = get_station_arrays()
+        station_distances_from_start = haversine_vec(*self.route_coords[0], stations['lons'], stations['lats'])
 
         candidates = find_candidate_stations_near_segment(
             self.route_coords, self.cumulative_distances,
             self.segment_start_index, self.segment_end_index,
-            self.proximity_threshold_miles, self.last_stop_distance_from_start
+            self.proximity_threshold_miles, self.last_stop_distance_from_start,
+            station_distances_from_start
         )
 
-        # Expect station1 and station2 to be found as candidates (near segment and ahead of last stop)
-        self.assertEqual(len(candidates), 2)
-        candidate_opis_ids = {c['station_obj'].opis_truckstop_id for c in candidates}
-        self.assertIn(self.station1.opis_truckstop_id, candidate_opis_ids)
-        self.assertIn(self.station2.opis_truckstop_id, candidate_opis_ids)
-        self.assertNotIn(self.station3.opis_truckstop_id, candidate_opis_ids) # No coordinates
-        self.assertNotIn(self.station4.opis_truckstop_id, candidate_opis_ids) # Not ahead of last stop
+        self.assertEqual(candidates, self._find_candidates())
 
+    def test_find_candidate_stations_with_route_extent_tables(self):
+        """Test looking the segment's box up in the route extent tables finds the same candidates."""
+        candidates = find_candidate_stations_near_segment(
+            self.route_coords, self.cumulative_distances,
+            self.segment_start_index, self.segment_end_index,
+            self.proximity_threshold_miles, self.last_stop_distance_from_start,
+            route_extent_tables=build_route_extent_tables(self.route_coords)
+        )
 
-    def test_find_candidate_stations_near_segment_none_found(self, mock_haversine):
-        """Test finding no stations near the segment."""
-        # Configure mock_haversine so no stations are near the segment or ahead of last stop
-        mock_haversine.side_effect = lambda c1, c2: 30 # Always return a distance > proximity_threshold
+        self.assertEqual(candidates, self._find_candidates())
 
+    def test_find_candidate_stations_with_route_point_radians(self):
+        """Test slicing the segment out of the route's precomputed radians finds the same candidates."""
         candidates = find_candidate_stations_near_segment(
             self.route_coords, self.cumulative_distances,
             self.segment_start_index, self.segment_end_index,
-            self.proximity_threshold_miles, self.last_stop_distance_from_start
+            self.proximity_threshold_miles, self.last_stop_distance_from_start,
+            route_point_radians=build_route_point_radians(self.route_coords)
+        )
+
+        self.assertEqual(candidates, self._find_candidates())
+
+    def test_find_candidate_stations_in_blocks(self):
+        """Test splitting the distance matrix into small station blocks finds the same candidates."""
+        expected = self._find_candidates()
+
+        # Two segment points per block, so one station at a time
+        with patch('routeplanner.utils.CANDIDATE_SEARCH_BLOCK_ELEMENTS', 2):
+            candidates = self._find_candidates()
+
+        self.assertEqual(candidates, expected)
+
+    def test_find_candidate_stations_with_station_tree(self):
+        """Test the R-tree used for large station tables finds the same candidates as the array scan."""
+        expected = self._find_candidates()
+
+        with patch('routeplanner.utils.STATION_TREE_MIN_STATIONS', 1):
+            clear_station_arrays()
+            self.assertIsNotNone(get_station_arrays()['tree'])
+            candidates = self._find_candidates()
+        clear_station_arrays()
+
+        self.assertEqual(candidates, expected)
+
+    def test_find_candidate_stations_uses_given_station_arrays(self):
+        """Test arrays passed in are searched without loading the station table."""
+        station_arrays = get_station_arrays()
+        clear_station_arrays()
+
+        with self.assertNumQueries(0):
+            candidates = find_candidate_stations_near_segment(
+                self.route_coords, self.cumulative_distances,
+                self.segment_start_index, self.segment_end_index,
+                self.proximity_threshold_miles, self.last_stop_distance_from_start,
+                station_arrays=station_arrays
+            )
+
+        self.assertEqual(
+            {c['opis_truckstop_id'] for c in candidates},
+            {self.station2.opis_truckstop_id, self.station6.opis_truckstop_id}
         )
 
+    def test_find_candidate_stations_near_segment_none_found(self):
+        """Test finding no stations when none are both near the segment and ahead of the last stop."""
+        candidates = self._find_candidates(last_stop_distance_from_start=100)
+
         # Expect no candidates to be found
         self.assertEqual(len(candidates), 0)
 
-    def test_find_candidate_stations_near_segment_no_stations_in_db(self, mock_haversine):
+    def test_find_candidate_stations_behind_last_stop_skipped(self):
+        """Test stations behind the last stop are dropped before any segment distance is measured."""
+        with patch('routeplanner.utils.build_route_point_radians') as mock_build_route_point_radians:
+            candidates = self._find_candidates(last_stop_distance_from_start=100)
+
+        self.assertEqual(candidates, [])
+        mock_build_route_point_radians.assert_not_called()
+
+    def test_find_candidate_stations_outside_bounding_box_skipped(self):
+        """Test stations outside the segment's bounding box are never considered."""
+        # A box around station2 only, so station6 is skipped even though it is near and ahead
+        with patch('routeplanner.utils.bounding_box', return_value=(40.05, 40.15, -74.15, -74.05)):
+            candidates = self._find_candidates()
+
+        candidate_opis_ids = {c['opis_truckstop_id'] for c in candidates}
+        self.assertEqual(candidate_opis_ids, {self.station2.opis_truckstop_id})
+
+    def test_find_candidate_stations_loads_stations_once(self):
+        """Test the station arrays are read from the database once and reused across segments."""
+        with self.assertNumQueries(1):
+            first_candidates = self._find_candidates()
+            second_candidates = self._find_candidates()
+
+        self.assertTrue(first_candidates)
+        self.assertEqual(first_candidates, second_candidates)
+
+    def test_find_candidate_stations_reloaded_after_station_saved(self):
+        """Test saving a station invalidates the loaded station arrays."""
+        self._find_candidates()
+        self.station2.retail_price = 2.50
+        self.station2.save()
+
+        candidates = self._find_candidates()
+
+        station2_candidate = next(c for c in candidates if c['opis_truckstop_id'] == self.station2.opis_truckstop_id)
+        self.assertEqual(station2_candidate['fuel_price_per_gallon'], 2.50)
+
+    def test_find_candidate_stations_near_segment_no_stations_in_db(self):
         """Test with no stations in the database."""
         GasStation.objects.all().delete() # Delete all stations
 
-        candidates = find_candidate_stations_near_segment(
-            self.route_coords, self.cumulative_distances,
-            self.segment_start_index, self.segment_end_index,
-            self.proximity_threshold_miles, self.last_stop_distance_from_start
-        )
+        candidates = self._find_candidates()
 
         # Expect no candidates to be found
         self.assertEqual(len(candidates), 0)
 
 
+def mock_find_route_point_index_side_effect(cumulative_distances, target_distance, start_index=0):
+    """Stand-in for find_route_point_index_by_distance in the mocked find_stops tests."""
+    index = bisect_left(cumulative_distances, target_distance, start_index)
+    return min(index, len(cumulative_distances) - 1)
+
+
 # Patch dependencies for find_stops
 @patch('routeplanner.utils.find_candidate_stations_near_segment')
 @patch('routeplanner.utils.calculate_cumulative_distances')
 @patch('routeplanner.utils.find_route_point_index_by_distance') # Patch this as well
-class FindStopsTests(TestCase):
+class FindStopsTests(SimpleTestCase):
     """Tests for the main find_stops function."""
 
+    def setUp(self):
+        # Candidate lookup is mocked, so serve empty station arrays instead of querying the database
+        patcher = patch('routeplanner.utils.get_station_arrays', return_value={
+            'lons': np.empty(0, dtype=np.float32), 'lats': np.empty(0, dtype=np.float32), 'locations': np.empty((0, 2)),
+            'prices': np.empty(0), 'ids': np.empty(0, dtype=object), 'tree': None,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_find_stops_no_stops_needed(self, mock_find_route_point_index_by_distance, mock_calculate_cumulative_distances, mock_find_candidate_stations_near_segment):
         """Test a short route where no stops are needed within max range."""
         route_coords = [(-74.0, 40.0), (-73.0, 41.0)] # Short route
@@ -284,6 +613,21 @@ class FindStopsTests(TestCase):
         # In this scenario, the loop condition to trigger stop search should not be met,
         # so find_candidate_stations_near_segment should NOT be called.
         mock_find_candidate_stations_near_segment.assert_not_called()
+        # Nor are cumulative distances needed to find that out
+        mock_calculate_cumulative_distances.assert_not_called()
+
+    def test_find_stops_uses_precomputed_cumulative_distances(self, mock_find_route_point_index_by_distance, mock_calculate_cumulative_distances, mock_find_candidate_stations_near_segment):
+        """Test cumulative distances passed in by the caller are not recalculated."""
+        route_coords = [(-74.0, 40.0), (-73.0, 41.0)]
+        mock_find_route_point_index_by_distance.return_value = len(route_coords) - 1
+        mock_find_candidate_stations_near_segment.return_value = []
+
+        # Longer than the range, so the route is actually walked
+        optimal_stops = find_stops(route_coords, 400, 300, cumulative_distances=[0, 400])
+
+        self.assertEqual(optimal_stops, [])
+        mock_find_candidate_stations_near_segment.assert_called()
+        mock_calculate_cumulative_distances.assert_not_called()
 
 
     def test_find_stops_with_stops_found(self, mock_find_route_point_index_by_distance, mock_calculate_cumulative_distances, mock_find_candidate_stations_near_segment):
@@ -297,37 +641,20 @@ class FindStopsTests(TestCase):
         mock_calculate_cumulative_distances.return_value = cumulative_dists
 
         # Mock find_route_point_index_by_distance to return appropriate indices
-        def mock_find_route_point_index_side_effect(cumulative_distances, target_distance, start_index=0):
-            for j in range(start_index, len(cumulative_distances)):
-                 if cumulative_distances[j] >= target_distance:
-                     return j
-            return len(cumulative_distances) - 1
-
         mock_find_route_point_index_by_distance.side_effect = mock_find_route_point_index_side_effect
 
 
-        # Configure mock_find_candidate_stations_near_segment to return candidates at specific points
-        # Corrected side_effect function signature to accept positional arguments
-        def find_candidates_side_effect(route_coords, cumulative_distances, segment_start_index, segment_end_index, proximity_threshold_miles, last_stop_distance_from_start):
-            # Simulate finding a cheap station when the segment starts around distances where stops are needed
-            current_dist = cumulative_distances[segment_start_index]
-
-            # Based on trace, stops are needed when segment_start_index (i) is 0 and 2.
-            if segment_start_index == 0: # First segment
-                 return [{
-                     'location': [40.5, -74.5],
-                     'fuel_price_per_gallon': 3.05,
-                     'distance_from_start_straight_line_miles': current_dist + 155, # Dummy ahead distance relative to current_dist
-                     'station_obj': MagicMock()
-                 }]
-            elif segment_start_index == 2: # Segment starting around cumulative dist 300
-                 return [{
-                     'location': [41.5, -75.5],
-                     'fuel_price_per_gallon': 3.15,
-                     'distance_from_start_straight_line_miles': current_dist + 155, # Dummy ahead distance relative to current_dist
-                     'station_obj': MagicMock()
-                 }]
-            return [] # No candidates found otherwise
+        # Configure mock_find_candidate_stations_near_segment like real geometry: each station
+        # is near one route point and is a candidate for every segment containing that point
+        stations_by_route_index = {
+            0: {'location': [40.5, -74.5], 'fuel_price_per_gallon': 3.05, 'distance_from_start_straight_line_miles': 155, 'opis_truckstop_id': 'S1'},
+            2: {'location': [41.5, -75.5], 'fuel_price_per_gallon': 3.15, 'distance_from_start_straight_line_miles': 455, 'opis_truckstop_id': 'S2'},
+        }
+        def find_candidates_side_effect(route_coords, cumulative_distances, segment_start_index, segment_end_index, proximity_threshold_miles, last_stop_distance_from_start, station_distances_from_start=None, route_extent_tables=None, station_arrays=None, route_point_radians=None):
+            return [
+                station for index, station in stations_by_route_index.items()
+                if segment_start_index <= index <= segment_end_index
+            ]
 
         mock_find_candidate_stations_near_segment.side_effect = find_candidates_side_effect
 
@@ -336,7 +663,17 @@ class FindStopsTests(TestCase):
 
         # Expect two optimal stops to be found based on the side effect logic
         self.assertEqual(len(optimal_stops), 2)
+        self.assertEqual([stop['location'] for stop in optimal_stops], [[40.5, -74.5], [41.5, -75.5]])
         # You could add more specific assertions about the stops found based on the side effect logic
+        # Station distances from the route start are computed once and shared by every segment,
+        # together with the one set of station arrays they were measured against
+        station_distance_arrays = {id(call.args[6]) for call in mock_find_candidate_stations_near_segment.call_args_list}
+        self.assertEqual(len(station_distance_arrays), 1)
+        station_arrays = {id(call.args[8]) for call in mock_find_candidate_stations_near_segment.call_args_list}
+        self.assertEqual(len(station_arrays), 1)
+        # The route points are converted to radians once for every segment search
+        route_point_radians = {id(call.args[9]) for call in mock_find_candidate_stations_near_segment.call_args_list}
+        self.assertEqual(len(route_point_radians), 1)
 
 
     def test_find_stops_no_candidates_found_when_needed(self, mock_find_route_point_index_by_distance, mock_calculate_cumulative_distances, mock_find_candidate_stations_near_segment):
@@ -350,17 +687,12 @@ class FindStopsTests(TestCase):
         mock_calculate_cumulative_distances.return_value = cumulative_dists
 
         # Mock find_route_point_index_by_distance
-        def mock_find_route_point_index_side_effect(cumulative_distances, target_distance, start_index=0):
-            for j in range(start_index, len(cumulative_distances)):
-                 if cumulative_distances[j] >= target_distance:
-                     return j
-            return len(cumulative_distances) - 1
         mock_find_route_point_index_by_distance.side_effect = mock_find_route_point_index_side_effect
 
 
         # Configure mock_find_candidate_stations_near_segment to always return an empty list
         # Corrected side_effect function signature to accept positional arguments
-        def find_candidates_side_effect(route_coords, cumulative_distances, segment_start_index, segment_end_index, proximity_threshold_miles, last_stop_distance_from_start):
+        def find_candidates_side_effect(route_coords, cumulative_distances, segment_start_index, segment_end_index, proximity_threshold_miles, last_stop_distance_from_start, station_distances_from_start=None, route_extent_tables=None, station_arrays=None, route_point_radians=None):
              return [] # Always return empty list
 
         mock_find_candidate_stations_near_segment.side_effect = find_candidates_side_effect
@@ -1,8 +1,33 @@
 import math
+import time
+from bisect import bisect_left
 from math import radians, cos, sin, asin, sqrt
+from operator import itemgetter
+import numpy as np
 from django.db.models import F
+from rtree import index as rtree_index
 from .models import GasStation
 
+EARTH_RADIUS_MILES = 3956
+MILES_PER_DEGREE_LATITUDE = 69.0
+# Bounds the (locations, route points) float64 block in find_nearest_route_point_indices to ~8 MB
+NEAREST_SEARCH_BLOCK_ELEMENTS = 1_000_000
+# Bounds the (stations, segment points) float32 block in find_candidate_stations_near_segment to ~4 MB
+CANDIDATE_SEARCH_BLOCK_ELEMENTS = 1_000_000
+# Rows fetched per round trip when loading the station arrays
+STATION_QUERY_CHUNK_SIZE = 2000
+# Seconds before the station arrays are reloaded. Signals only cover model saves and
+# deletes in this process, so this bounds staleness from bulk writes and other processes.
+STATION_ARRAYS_TIMEOUT = 300
+# Below this many stations a NumPy mask over the arrays beats an R-tree bounding box query
+STATION_TREE_MIN_STATIONS = 25_000
+# Station coordinates are searched in single precision: under a meter of quantization,
+# and float32 trig ufuncs ran the (stations, segment points) distances about 3.5x faster
+STATION_COORDS_DTYPE = np.float32
+
+_station_arrays = None
+_station_arrays_loaded_at = 0.0
+
 def haversine(coord1, coord2):
     """
     Calculate distance between two points on Earth (miles).
@@ -10,27 +35,83 @@ def haversine(coord1, coord2):
     """
     lon1, lat1 = coord1
     lon2, lat2 = coord2
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1)*cos(lat2)*sin(dlon/2)**2
+    # Converted inline rather than through map() over a temporary list, this runs once per pair
+    lat1 = radians(lat1)
+    lat2 = radians(lat2)
+    sin_half_dlat = sin((lat2 - lat1) / 2)
+    sin_half_dlon = sin(radians(lon2 - lon1) / 2)
+    a = sin_half_dlat*sin_half_dlat + cos(lat1)*cos(lat2)*sin_half_dlon*sin_half_dlon
     c = 2 * asin(sqrt(a))
-    miles = 3956 * c
+    miles = EARTH_RADIUS_MILES * c
     return miles
 
-def calculate_cumulative_distances(route_coords, total_route_distance_miles):
+def haversine_vec(lons1, lats1, lons2, lats2):
+    """
+    Vectorized haversine distance (miles) between points given in degrees.
+    Inputs are scalars or arrays that broadcast against each other, so one call
+    can measure every station against every route point. Computed in float32 when
+    every input is float32, otherwise in float64.
+    Returns: NumPy array of distances with the broadcast shape of the inputs.
+    """
+    values = [np.asarray(values) for values in (lons1, lats1, lons2, lats2)]
+    dtype = np.result_type(*values, np.float32)
+    lons1, lats1, lons2, lats2 = (np.radians(values, dtype=dtype) for values in values)
+    dlon = lons2 - lons1
+    dlat = lats2 - lats1
+    a = np.sin(dlat/2)**2 + np.cos(lats1)*np.cos(lats2)*np.sin(dlon/2)**2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+def route_segment_lengths(route):
+    """
+    Haversine length (miles) of each segment between consecutive route points.
+    Specialized from haversine_vec: every point is converted to radians and has its
+    cos(latitude) taken once, rather than once per segment end, and the remaining
+    arithmetic runs in place on two buffers.
+    route: float64 array of [longitude, latitude] rows.
+    Returns: Array with one length per segment, len(route) - 1 values.
+    """
+    route_radians = np.radians(route)
+    lons = route_radians[:, 0]
+    lats = route_radians[:, 1]
+    cos_lats = np.cos(lats)
+
+    a = np.diff(lats)
+    a *= 0.5
+    np.sin(a, out=a)
+    a *= a
+    sin_half_dlon_squared = np.diff(lons)
+    sin_half_dlon_squared *= 0.5
+    np.sin(sin_half_dlon_squared, out=sin_half_dlon_squared)
+    sin_half_dlon_squared *= sin_half_dlon_squared
+    sin_half_dlon_squared *= cos_lats[:-1]
+    sin_half_dlon_squared *= cos_lats[1:]
+    a += sin_half_dlon_squared
+
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * EARTH_RADIUS_MILES
+    return a
+
+def calculate_cumulative_distances(route_coords, total_route_distance_miles=None):
     """
     Calculates cumulative distance along route points.
+    All segment lengths are computed in one vectorized haversine pass.
     route_coords: List of [longitude, latitude] pairs.
-    total_route_distance_miles: Total route distance in miles.
+    total_route_distance_miles: Total route distance in miles, if known. The last
+        cumulative distance is snapped to it when they differ by more than a mile.
     Returns: List of cumulative distances.
     """
-    cumulative_distances = [0]
-    for i in range(1, len(route_coords)):
-        dist_segment = haversine(route_coords[i-1], route_coords[i])
-        cumulative_distances.append(cumulative_distances[-1] + dist_segment)
+    route = np.asarray(route_coords, dtype=np.float64).reshape(-1, 2)
+    segment_distances = route_segment_lengths(route)
+
+    # Accumulated straight into a buffer that already holds the leading zero
+    cumulative = np.zeros(max(len(route), 1))
+    np.cumsum(segment_distances, out=cumulative[1:])
+    # Plain floats, as callers index this element by element; an ndarray made
+    # find_stops' per-point loop about 4x slower through NumPy scalar boxing
+    cumulative_distances = cumulative.tolist()
 
-    if cumulative_distances and abs(cumulative_distances[-1] - total_route_distance_miles) > 1:
+    if total_route_distance_miles is not None and abs(cumulative_distances[-1] - total_route_distance_miles) > 1:
          cumulative_distances[-1] = total_route_distance_miles
 
     return cumulative_distances
@@ -38,15 +119,94 @@ def calculate_cumulative_distances(route_coords, total_route_distance_miles):
 def find_route_point_index_by_distance(cumulative_distances, target_distance, start_index=0):
     """
     Finds index of route point closest to a target distance from start.
-    cumulative_distances: List of cumulative distances.
+    cumulative_distances: List or NumPy array of cumulative distances.
     target_distance: Distance from start.
     start_index: Index to start search from.
-    Returns: Index of route point.
+    Returns: Index of the first route point at or beyond target_distance, or the last index.
     """
-    for j in range(start_index, len(cumulative_distances)):
-         if cumulative_distances[j] >= target_distance:
-             return j
-    return len(cumulative_distances) - 1
+    # Cumulative distances never decrease, so binary search replaces the linear walk.
+    # Seeding it with an interpolated guess was measured slower: the extra Python-level
+    # arithmetic costs more than the handful of comparisons bisect does in C.
+    if isinstance(cumulative_distances, np.ndarray):
+        # bisect would box every probed element into a NumPy scalar
+        index = start_index + int(np.searchsorted(cumulative_distances[start_index:], target_distance, side='left'))
+    else:
+        index = bisect_left(cumulative_distances, target_distance, start_index)
+    return min(index, len(cumulative_distances) - 1)
+
+def find_nearest_route_point_indices(route_coords, locations, shortlist_size=8, block_elements=NEAREST_SEARCH_BLOCK_ELEMENTS):
+    """
+    Finds, for each location, the index of the closest route point.
+    Candidates are shortlisted on a local equirectangular projection, which needs
+    no trigonometry per route point, then ranked with the exact haversine term.
+    Locations are processed in blocks so the (locations, route points) working
+    arrays stay around block_elements entries however long the route is.
+    route_coords: List of [longitude, latitude] pairs.
+    locations: List of [latitude, longitude] pairs.
+    shortlist_size: Number of projected nearest route points refined per location.
+    block_elements: Approximate size of the planar distance block computed at once.
+    Returns: NumPy array with one route point index per location.
+    """
+    route = np.asarray(route_coords) # (R, 2) as lon, lat
+    if route.dtype != np.float32:
+        route = route.astype(np.float64, copy=False)
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2) # (S, 2) as lat, lon
+    shortlist_size = min(shortlist_size, len(route))
+    route_lon = route[:, 0]
+    route_lat = route[:, 1]
+    # The shortlist is computed at the route's own precision, float32 routes halve its memory traffic
+    planar_locations = locations.astype(route.dtype)
+    block_size = max(1, block_elements // max(len(route), 1))
+
+    nearest = np.empty(len(locations), dtype=np.intp)
+    for block_start in range(0, len(locations), block_size):
+        block = locations[block_start:block_start + block_size]
+        planar_block = planar_locations[block_start:block_start + block_size]
+
+        # Planar squared distances, scaling longitude at each location's own latitude.
+        # Computed in place to avoid extra (block, R) temporaries.
+        planar = np.subtract(route_lon[None, :], planar_block[:, 1:2])
+        planar *= np.cos(np.radians(planar_block[:, 0:1]))
+        np.square(planar, out=planar)
+        dy = np.subtract(route_lat[None, :], planar_block[:, 0:1])
+        np.square(dy, out=dy)
+        planar += dy
+
+        # Sorted so that exact ties still resolve to the first route point
+        shortlist = np.sort(np.argpartition(planar, shortlist_size - 1, axis=1)[:, :shortlist_size], axis=1)
+
+        # Exact haversine term for the shortlisted points only, (block, shortlist_size)
+        route_rad = np.radians(route[shortlist], dtype=np.float64)
+        block_rad = np.radians(block)
+        dlat = route_rad[:, :, 1] - block_rad[:, None, 0]
+        dlon = route_rad[:, :, 0] - block_rad[:, None, 1]
+        a = np.sin(dlat/2)**2 + np.cos(block_rad[:, None, 0])*np.cos(route_rad[:, :, 1])*np.sin(dlon/2)**2
+
+        # The distance grows monotonically with a, so the closest point minimizes it
+        nearest[block_start:block_start + len(block)] = shortlist[np.arange(len(block)), np.argmin(a, axis=1)]
+
+    return nearest
+
+def encode_polyline(latlon_coords, precision=5):
+    """
+    Encodes coordinates with the Google encoded polyline algorithm.
+    latlon_coords: Sequence or (N, 2) array of [latitude, longitude] pairs.
+    precision: Number of decimal places kept.
+    Returns: The encoded polyline string.
+    """
+    scaled = np.round(np.asarray(latlon_coords, dtype=np.float64).reshape(-1, 2) * 10**precision).astype(np.int64)
+    # Each point is stored as its offset from the previous one, latitude first
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zig-zag encode so the sign ends up in the lowest bit
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+
+    chars = []
+    for value in values:
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
 
 def deduplicate_stops_by_location(stops_list):
     """
@@ -59,66 +219,235 @@ def deduplicate_stops_by_location(stops_list):
     Returns:
         A new list with duplicate stops (based on location) removed.
     """
-    seen_locations = set()
-    deduplicated_stops = []
+    # Keyed by the location list [lat, lon] as a hashable tuple (lat, lon); setdefault
+    # keeps the first stop and dicts keep insertion order, in one hash probe per stop
+    stops_by_location = {}
     for stop in stops_list:
-        # Convert the location list [lat, lon] to a hashable tuple (lat, lon)
-        location_tuple = tuple(stop['location'])
-        if location_tuple not in seen_locations:
-            deduplicated_stops.append(stop)
-            seen_locations.add(location_tuple)
-    return deduplicated_stops
+        stops_by_location.setdefault(tuple(stop['location']), stop)
+    return list(stops_by_location.values())
+
+def bounding_box(coords, margin_miles):
+    """
+    Calculates a latitude/longitude box containing every point within margin_miles of coords.
+    coords: List of [longitude, latitude] pairs.
+    margin_miles: Distance the box extends beyond the outermost points.
+    Returns: Tuple (lat_min, lat_max, lon_min, lon_max).
+    """
+    lons = [coord[0] for coord in coords]
+    lats = [coord[1] for coord in coords]
+    return _expand_extents(min(lats), max(lats), min(lons), max(lons), margin_miles)
+
+def _expand_extents(lat_min, lat_max, lon_min, lon_max, margin_miles):
+    lat_margin = margin_miles / MILES_PER_DEGREE_LATITUDE
+    # Longitude degrees shrink towards the poles, so size the margin at the highest latitude
+    widest_lat = min(max(abs(lat_min), abs(lat_max)) + lat_margin, 89.0)
+    lon_margin = margin_miles / (MILES_PER_DEGREE_LATITUDE * cos(radians(widest_lat)))
+    return lat_min - lat_margin, lat_max + lat_margin, lon_min - lon_margin, lon_max + lon_margin
+
+def build_route_extent_tables(route_coords):
+    """
+    Precomputes sparse tables of longitude/latitude minima and maxima over the route,
+    so the bounding box of any window of route points is found in constant time.
+    Level k of each table holds the extremes of every window of 2**k points.
+    route_coords: List of [longitude, latitude] pairs.
+    Returns: Tuple (minima, maxima), lists of (len(route) - 2**k + 1, 2) arrays.
+    """
+    route = np.asarray(route_coords).reshape(-1, 2)
+    minima = [route]
+    maxima = [route]
+    span = 1
+    while span * 2 <= len(route):
+        minima.append(np.minimum(minima[-1][:-span], minima[-1][span:]))
+        maxima.append(np.maximum(maxima[-1][:-span], maxima[-1][span:]))
+        span *= 2
+    return minima, maxima
+
+def build_route_point_radians(route_coords):
+    """
+    Converts every route point for the candidate station search once per route:
+    overlapping segment searches slice these instead of converting their points again.
+    route_coords: List of [longitude, latitude] pairs.
+    Returns: Tuple (lons, lats, cos_lats) of STATION_COORDS_DTYPE arrays, in radians.
+    """
+    route_radians = np.radians(np.asarray(route_coords, dtype=STATION_COORDS_DTYPE).reshape(-1, 2))
+    lons = route_radians[:, 0]
+    lats = route_radians[:, 1]
+    return lons, lats, np.cos(lats)
 
-def find_candidate_stations_near_segment(route_coords, cumulative_distances, segment_start_index, segment_end_index, proximity_threshold_miles, last_stop_distance_from_start):
+def route_window_bounding_box(route_extent_tables, start_index, end_index, margin_miles):
+    """
+    Same box as bounding_box(route_coords[start_index:end_index + 1], margin_miles),
+    read from tables built by build_route_extent_tables.
+    Returns: Tuple (lat_min, lat_max, lon_min, lon_max).
+    """
+    minima, maxima = route_extent_tables
+    # Two overlapping power-of-two windows cover the whole range
+    level = (end_index - start_index + 1).bit_length() - 1
+    second_start = end_index - (1 << level) + 1
+    lon_min, lat_min = np.minimum(minima[level][start_index], minima[level][second_start]).tolist()
+    lon_max, lat_max = np.maximum(maxima[level][start_index], maxima[level][second_start]).tolist()
+    return _expand_extents(lat_min, lat_max, lon_min, lon_max, margin_miles)
+
+def get_station_arrays():
+    """
+    Returns geocoded gas stations as parallel NumPy arrays, loading them on first use.
+    Returns: Dictionary with 'lons', 'lats' (STATION_COORDS_DTYPE), 'locations' (exact
+        float64 [latitude, longitude] rows for reporting), 'prices' and 'ids' arrays of
+        equal length, and 'tree', an R-tree over the station points for large tables,
+        otherwise None.
+    """
+    global _station_arrays, _station_arrays_loaded_at
+    # Read once: a concurrent clear_station_arrays() may reset the global at any point
+    station_arrays = _station_arrays
+    if station_arrays is None or time.monotonic() - _station_arrays_loaded_at > STATION_ARRAYS_TIMEOUT:
+        rows = list(GasStation.objects.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+            'longitude', 'latitude', 'retail_price', 'opis_truckstop_id'
+        ).iterator(chunk_size=STATION_QUERY_CHUNK_SIZE))
+        lons, lats, prices, ids = zip(*rows) if rows else ((), (), (), ())
+        # Built in full before being published with a single assignment
+        station_arrays = {
+            'lons': np.array(lons, dtype=STATION_COORDS_DTYPE),
+            'lats': np.array(lats, dtype=STATION_COORDS_DTYPE),
+            'locations': np.column_stack((np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64))).reshape(-1, 2),
+            'prices': np.array(prices, dtype=np.float64),
+            'ids': np.array(ids, dtype=object),
+            'tree': None,
+        }
+        if rows and len(rows) >= STATION_TREE_MIN_STATIONS:
+            # Bulk loaded from a stream, keyed by array position
+            station_arrays['tree'] = rtree_index.Index(
+                (i, (lon, lat, lon, lat), None) for i, (lon, lat) in enumerate(zip(lons, lats))
+            )
+        _station_arrays_loaded_at = time.monotonic()
+        _station_arrays = station_arrays
+    return station_arrays
+
+def clear_station_arrays(**kwargs):
+    """
+    Drops the loaded station arrays so the next lookup reads the database again.
+    Connected to GasStation's post_save and post_delete signals.
+    """
+    global _station_arrays
+    _station_arrays = None
+
+def find_candidate_stations_near_segment(route_coords, cumulative_distances, segment_start_index, segment_end_index, proximity_threshold_miles, last_stop_distance_from_start, station_distances_from_start=None, route_extent_tables=None, station_arrays=None, route_point_radians=None):
     """
     Finds gas stations near a specific route segment.
+    Stations outside the segment's bounding box are masked out of the station arrays,
+    the rest are measured against every segment point in one vectorized pass.
+    station_distances_from_start: Straight-line distance from route_coords[0] to every
+        station in station_arrays, computed here for the boxed stations if omitted.
+    route_extent_tables: Tables from build_route_extent_tables(route_coords), used to
+        look up the segment's bounding box instead of scanning its points.
+    station_arrays: Arrays from get_station_arrays() to search, fetched here if omitted.
+    route_point_radians: Tuple from build_route_point_radians(route_coords), converted
+        here for the segment points if omitted.
     Returns: List of candidate station dictionaries.
     """
-    candidate_stations = []
-    all_gas_stations = GasStation.objects.filter(latitude__isnull=False, longitude__isnull=False)
-    
-    for station in all_gas_stations:
-        station_coords = (float(station.longitude), float(station.latitude))
-
-        is_near_route_segment = False
-        for k in range(segment_start_index, segment_end_index + 1):
-            route_point_coords = route_coords[k]
-            dist_to_route_point = haversine(station_coords, route_point_coords)
-            if dist_to_route_point < proximity_threshold_miles:
-                is_near_route_segment = True
-                break
-
-        if is_near_route_segment:
-            dist_station_from_start_straight_line = haversine(route_coords[0], station_coords)
-            if dist_station_from_start_straight_line > last_stop_distance_from_start:
-                candidate_stations.append({
-                    'location': [float(station.latitude), float(station.longitude)],
-                    'fuel_price_per_gallon': float(station.retail_price),
-                    'distance_from_start_straight_line_miles': dist_station_from_start_straight_line,
-                    'station_obj': station
-                })
-    return candidate_stations
+    stations = get_station_arrays() if station_arrays is None else station_arrays
+    segment = slice(segment_start_index, segment_end_index + 1)
+    segment_length = segment_end_index - segment_start_index + 1
+    if route_extent_tables is None:
+        segment_coords = np.asarray(route_coords[segment], dtype=np.float64).reshape(-1, 2)
+        lat_min, lat_max, lon_min, lon_max = bounding_box(segment_coords, proximity_threshold_miles)
+    else:
+        lat_min, lat_max, lon_min, lon_max = route_window_bounding_box(
+            route_extent_tables, segment_start_index, segment_end_index, proximity_threshold_miles
+        )
+    if stations['tree'] is not None:
+        in_box = np.sort(np.fromiter(stations['tree'].intersection((lon_min, lat_min, lon_max, lat_max)), dtype=np.intp))
+    else:
+        in_box = np.flatnonzero(
+            (stations['lats'] >= lat_min) & (stations['lats'] <= lat_max) &
+            (stations['lons'] >= lon_min) & (stations['lons'] <= lon_max)
+        )
+    if not len(in_box):
+        return []
+
+    # Stations no further from the start than the last stop can never be candidates,
+    # so they are dropped before the distance matrix rather than masked out after it
+    if station_distances_from_start is None:
+        route_start_lon, route_start_lat = route_coords[0]
+        dist_station_from_start_straight_line = haversine_vec(
+            route_start_lon, route_start_lat, stations['lons'][in_box], stations['lats'][in_box]
+        )
+    else:
+        dist_station_from_start_straight_line = station_distances_from_start[in_box]
+    is_ahead = dist_station_from_start_straight_line > last_stop_distance_from_start
+    in_box = in_box[is_ahead]
+    dist_station_from_start_straight_line = dist_station_from_start_straight_line[is_ahead]
+    if not len(in_box):
+        return []
+
+    station_lons = stations['lons'][in_box]
+    station_lats = stations['lats'][in_box]
+
+    # (stations, segment points) distances, a station is near if any point is within the threshold.
+    # Computed a block of stations at a time so long segments cannot build an unbounded matrix.
+    # Both sides are converted to radians and have cos(latitude) taken once, not once per block,
+    # and the threshold is compared against the haversine term instead of the arcsine of it.
+    if route_point_radians is None:
+        segment_lons, segment_lats, segment_cos_lats = build_route_point_radians(route_coords[segment])
+    else:
+        segment_lons, segment_lats, segment_cos_lats = (values[segment] for values in route_point_radians)
+    station_lons_rad = np.radians(station_lons)
+    station_lats_rad = np.radians(station_lats)
+    station_cos_lats = np.cos(station_lats_rad)
+    threshold_a = math.sin(min(proximity_threshold_miles / (2 * EARTH_RADIUS_MILES), math.pi / 2)) ** 2
+    block_size = max(1, CANDIDATE_SEARCH_BLOCK_ELEMENTS // segment_length)
+    is_near_route_segment = np.empty(len(in_box), dtype=bool)
+    for block_start in range(0, len(in_box), block_size):
+        block = slice(block_start, block_start + block_size)
+        a = np.sin((segment_lats[None, :] - station_lats_rad[block, None]) / 2) ** 2 + (
+            station_cos_lats[block, None] * segment_cos_lats[None, :] *
+            np.sin((segment_lons[None, :] - station_lons_rad[block, None]) / 2) ** 2
+        )
+        is_near_route_segment[block] = (a < threshold_a).any(axis=1)
+
+    return [
+        {
+            'location': stations['locations'][in_box[i]].tolist(),
+            'fuel_price_per_gallon': float(stations['prices'][in_box[i]]),
+            'distance_from_start_straight_line_miles': float(dist_station_from_start_straight_line[i]),
+            'opis_truckstop_id': stations['ids'][in_box[i]]
+        }
+        for i in np.flatnonzero(is_near_route_segment)
+    ]
 
 def select_cheapest_stop(candidate_stations):
     """
     Selects the cheapest station from candidates.
     Returns: Dictionary for cheapest station, or None.
     """
-    if candidate_stations:
-        return min(candidate_stations, key=lambda x: x['fuel_price_per_gallon'])
-    return None
+    return min(candidate_stations, key=itemgetter('fuel_price_per_gallon'), default=None)
 
 
-def find_stops(route_coords, total_route_distance_miles, max_range_miles):
+def find_stops(route_coords, total_route_distance_miles, max_range_miles, cumulative_distances=None):
     """
     Finds optimal fuel stops along the route.
     Queries GasStation model.
+    cumulative_distances: Precomputed cumulative distances for route_coords, calculated if omitted.
     Returns: List of optimal fuel stop dictionaries.
     """
+    # The whole route fits in one tank: the loop below would never search for a stop
+    if total_route_distance_miles <= max_range_miles:
+        return []
+
     optimal_stops = []
     last_stop_distance_from_start = 0
 
-    cumulative_distances = calculate_cumulative_distances(route_coords, total_route_distance_miles)
+    if cumulative_distances is None:
+        cumulative_distances = calculate_cumulative_distances(route_coords, total_route_distance_miles)
+
+    # The route start is fixed, so every station's distance from it is measured once here.
+    # The same arrays are passed to every search: the precomputed distances are indexed by
+    # station position, which a reload partway through the loop would shift.
+    stations = get_station_arrays()
+    route_start_lon, route_start_lat = route_coords[0]
+    station_distances_from_start = haversine_vec(route_start_lon, route_start_lat, stations['lons'], stations['lats'])
+    # Candidate searches overlap heavily, so segment bounding boxes come from shared tables
+    route_extent_tables = build_route_extent_tables(route_coords)
+    route_point_radians = build_route_point_radians(route_coords)
 
     i = 0
     proximity_threshold_miles = 10
@@ -136,7 +465,11 @@ def find_stops(route_coords, total_route_distance_miles, max_range_miles):
 
         distance_to_next_stop_target_point = cumulative_distances[next_stop_target_index] - current_distance_from_start
 
-        if remaining_distance_total > current_range and distance_to_next_stop_target_point > current_range:
+        if remaining_distance_total <= current_range:
+            # The end is in range of the last stop, which only moves when a stop is added
+            break
+
+        if distance_to_next_stop_target_point > current_range:
 
              look_ahead_distance = current_range
 
@@ -148,7 +481,11 @@ def find_stops(route_coords, total_route_distance_miles, max_range_miles):
                  i,
                  look_ahead_index,
                  proximity_threshold_miles,
-                 last_stop_distance_from_start
+                 last_stop_distance_from_start,
+                 station_distances_from_start,
+                 route_extent_tables,
+                 stations,
+                 route_point_radians
              )
 
              cheapest_stop = select_cheapest_stop(candidate_stations)
@@ -161,7 +498,13 @@ def find_stops(route_coords, total_route_distance_miles, max_range_miles):
                  })
 
                  last_stop_distance_from_start = current_distance_from_start
-
-        i += 1
+                 i += 1
+             else:
+                 # Until the last stop moves, every later window up to look_ahead_index lies
+                 # inside this one, so it cannot find a candidate either
+                 i = look_ahead_index + 1
+        else:
+            # A route point sits exactly at the target; the points before it are in the same position
+            i = next_stop_target_index + 1
 
     return deduplicate_stops_by_location(optimal_stops)
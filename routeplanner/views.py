@@ -1,7 +1,7 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from routeplanner.services.route_planner import RoutePlanner
+from routeplanner.services.route_planner import RoutePlanError, RoutePlanner
 from routeplanner.serializers import RouteParametersSerializer
 
 
@@ -23,9 +23,10 @@ class RouteAPIView(APIView):
 
         try:
             planner = RoutePlanner(start_coords, end_coords)
-            result = planner.plan()
+            result = planner.plan(geometry_format=validated_data.get('geometry_format', 'latlon'))
             return Response(result, status=status.HTTP_200_OK)
 
-        except Exception as e:
+        # Anything else is a bug and is left to DRF's exception handling
+        except RoutePlanError as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 